@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+from collections import deque
+
+class Overloaded(Exception):
+    """The server is at capacity; retry after retry_after seconds (HTTP 429)."""
+
+    def __init__(self, retry_after, message="Server is at capacity"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """A request's deadline passed before its work started (HTTP 503)."""
+
+    def __init__(self, retry_after=1, message="Request deadline exceeded while queued"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def expired(deadline):
+    """Whether a time.monotonic() deadline (or None for no deadline) has passed."""
+    return deadline is not None and time.monotonic() >= deadline
+
+class Ticket:
+    """An admitted request. Release it once the response is complete."""
+
+    def __init__(self, controller, deadline):
+        self.controller = controller
+        self.deadline = deadline
+        # time.perf_counter() at admission, where request metrics start timing
+        self.admitted_at = time.perf_counter()
+        self._admitted = time.monotonic()
+        self._released = False
+
+    def shorten(self, timeout_s):
+        """Bring the deadline forward to timeout_s seconds after admission, if that is sooner."""
+        if timeout_s and timeout_s > 0:
+            deadline = self._admitted + timeout_s
+            self.deadline = deadline if self.deadline is None else min(self.deadline, deadline)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release()
+
+class AdmissionController:
+    """
+    Bounds the number of requests in the server (generating or waiting) and
+    assigns each one a deadline.
+
+    admit() fails fast with Overloaded once max_requests are in flight, with
+    a Retry-After estimate derived from the completion rate measured over the
+    last window_s seconds. A max_requests of 0 disables the limit.
+    """
+
+    def __init__(self, max_requests=64, default_timeout_s=30, window_s=60):
+        self.max_requests = max_requests
+        self.default_timeout_s = default_timeout_s
+        self.window_s = window_s
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completions = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def active(self):
+        """Number of admitted requests that haven't been released."""
+        return self._active
+
+    def _prune(self, now):
+        while self._completions and now - self._completions[0] > self.window_s:
+            self._completions.popleft()
+
+    def throughput(self):
+        """Completed requests per second over the measurement window."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            if len(self._completions) < 2:
+                return None
+            span = max(now - self._completions[0], 1e-3)
+            return len(self._completions) / span
+
+    def retry_after(self, backlog=None):
+        """Seconds until roughly backlog requests complete, at least 1."""
+        if backlog is None:
+            backlog = max(1, self._active - self.max_requests + 1)
+        rate = self.throughput()
+        if not rate:
+            return 1
+        return max(1, min(60, math.ceil(backlog / rate)))
+
+    def admit(self, timeout_s=None):
+        """
+        Admit a request and return its Ticket, or raise Overloaded.
+        timeout_s overrides the default deadline if it is shorter.
+        """
+        with self._lock:
+            full = self.max_requests > 0 and self._active >= self.max_requests
+            if full:
+                self.rejected += 1
+            else:
+                self._active += 1
+                self.admitted += 1
+        if full:
+            raise Overloaded(self.retry_after())
+
+        timeouts = [t for t in (self.default_timeout_s, timeout_s) if t and t > 0]
+        deadline = time.monotonic() + min(timeouts) if timeouts else None
+        return Ticket(self, deadline)
+
+    def _release(self):
+        now = time.monotonic()
+        with self._lock:
+            self._active -= 1
+            self._completions.append(now)
+            self._prune(now)
+
+    def stats(self):
+        """Current load and admission counters."""
+        return {
+            "active": self._active,
+            "max_requests": self.max_requests,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "throughput": self.throughput(),
+        }
@@ -1,14 +1,27 @@
-import io
-import os
-import tempfile
+import contextlib
+import itertools
 import torch
-import torchaudio as ta
 import json
-import re
 import base64
-from fastapi import FastAPI, Form, File, UploadFile, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
-from chatterbox.mtl_tts import ChatterboxMultilingualTTS
+import asyncio
+import time
+from fastapi import APIRouter, FastAPI, Form, File, UploadFile, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+import config
+from inference import InferenceExecutor, BatchScheduler, PriorityLimiter, FairScheduler
+from admission import AdmissionController, Overloaded, DeadlineExceeded, expired
+from cancellation import CancelToken, Cancelled
+from conditioning import ConditioningCache, hash_audio
+from audio_cache import AudioCache, audio_cache_key
+from voices import VoiceRegistry
+from reference_audio import ReferenceAudioError, check_size, decode_base64_size, read_upload
+from uploads import UploadRoute
+import audio_protocol
+from audio_encoding import create_encoder, pcm_buffer, wav_buffer
+from backends import load_backend
+from replicas import ReplicaPool
+from segmentation import segment_text
+import metrics
 
 # --- Model and Device Setup ---
 
@@ -22,225 +35,1311 @@ else:
 
 print(f"Using device: {device}")
 
-# Load the multilingual TTS model from Hugging Face
-try:
-    tts_model = ChatterboxMultilingualTTS.from_pretrained(device=device)
-except Exception as e:
-    print(f"Error loading model: {e}")
-    # Exit if the model can't be loaded, as the app is useless without it.
-    exit()
+# TTS backend serving all model calls, set once loaded (see backends.py)
+backend = None
+sample_rate = None
 
-# --- Helper Functions ---
+# Startup progress reported by /health/live and /health/ready:
+# "loading", then "warming_up", then "ready" (or "failed")
+startup = {"status": "loading", "error": None}
+
+def load_model():
+    """
+    Load the configured backend, or start backend replicas. Blocking; called
+    from the lifespan hook so the server is already answering health checks.
+    """
+    global backend, sample_rate
 
-def chunk_text(text, max_chunk_size=200):
+    if config.REPLICAS > 0:
+        # Model replicas in separate processes; this process only dispatches
+        loaded = ReplicaPool(
+            config.REPLICAS,
+            device=device,
+            threads_per_replica=config.REPLICA_THREADS,
+            pin_cores=config.REPLICA_PIN_CORES,
+            backend=config.BACKEND,
+        )
+        print(f"Model replicas: {config.REPLICAS}")
+    else:
+        loaded = load_backend(device)
+    sample_rate = loaded.sr
+    backend = loaded
+
+def warm_up():
     """
-    Split text into chunks at sentence boundaries, respecting max_chunk_size.
+    Synthesize a short text once per warm-up language, so lazy initialization
+    and kernel selection happen before the first real request. With replicas,
+    every replica is warmed up. Runs on an inference worker.
     """
-    # Split by sentence endings
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        # If adding this sentence would exceed max size, save current chunk
-        if len(current_chunk) + len(sentence) > max_chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence
+    for language in config.WARMUP_LANGUAGES:
+        start = time.perf_counter()
+        results = backend.warm_up(language, config.WARMUP_TEXT)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            print(f"Warm-up failed for language {language}: {errors[0]}")
         else:
-            current_chunk += " " + sentence if current_chunk else sentence
-    
-    # Add the last chunk if it exists
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+            print(f"Warm-up for language {language} took {time.perf_counter() - start:.1f}s")
+
+async def start_model():
+    """Load and warm up the model in the background, then mark the server ready."""
+    try:
+        await asyncio.to_thread(load_model)
+        if config.WARMUP:
+            startup["status"] = "warming_up"
+            await inference.run(warm_up)
+        startup["status"] = "ready"
+        print("Server ready")
+    except Exception as e:
+        startup.update(status="failed", error=f"{type(e).__name__}: {e}")
+        print(f"Error loading model: {e}")
+
+def ready():
+    return startup["status"] == "ready"
+
+# Dedicated worker pool for blocking model calls. With replicas, each
+# worker thread waits on one replica, so there is at least one per replica.
+inference_workers = max(config.INFERENCE_WORKERS, config.REPLICAS)
+inference = InferenceExecutor(
+    max_workers=inference_workers,
+    max_queue_size=config.INFERENCE_QUEUE_SIZE,
+)
+print(f"Inference workers: {inference_workers}, queue size: {config.INFERENCE_QUEUE_SIZE}")
+
+# Shares the inference workers fairly between clients and priority classes,
+# one chunk at a time; None generates chunks in arrival order
+scheduler = FairScheduler(inference_workers, config.PRIORITY_CLASSES) if config.FAIR_SCHEDULING else None
+
+# Bounds requests in flight and gives each a deadline
+admission = AdmissionController(
+    max_requests=config.MAX_REQUESTS,
+    default_timeout_s=config.REQUEST_TIMEOUT_S,
+)
+
+# Prepared speaker conditionals, keyed by reference-audio content hash
+conditioning_cache = ConditioningCache(
+    max_entries=config.CONDITIONING_CACHE_SIZE,
+    max_bytes=config.CONDITIONING_CACHE_MB * 1024 * 1024,
+)
+
+# Generated audio for repeated text, keyed by text, language and voice
+audio_cache = AudioCache(
+    max_entries=config.AUDIO_CACHE_SIZE,
+    max_bytes=config.AUDIO_CACHE_MB * 1024 * 1024,
+    disk_dir=config.AUDIO_CACHE_DIR,
+    disk_max_bytes=config.AUDIO_CACHE_DISK_MB * 1024 * 1024,
+)
+
+# Voices uploaded through POST /voices, persisted across restarts
+voice_registry = VoiceRegistry(
+    config.VOICES_DIR,
+    load_fn=lambda path: backend.load_conditionals(path),
+)
+
+# Load gauges exported on /metrics next to the per-request metrics
+metrics.gauge("tts_ready", "1 once the model is loaded and warmed up.", lambda: int(ready()))
+metrics.gauge("tts_active_requests", "Admitted requests that haven't completed.", lambda: admission.active)
+metrics.gauge("tts_inference_pending", "Model calls queued or running on inference workers.", lambda: inference.pending)
+metrics.gauge(
+    "tts_scheduler_waiting", "Chunks waiting for their fair share of the inference workers.",
+    lambda: scheduler.waiting if scheduler is not None else 0,
+)
+
+# Cache counters, read from the caches' stats() at scrape time
+metrics.counter_fn(
+    "tts_conditioning_cache_hits_total", "Conditioning cache lookups that found prepared conditionals.",
+    lambda: conditioning_cache.stats()["hits"],
+)
+metrics.counter_fn(
+    "tts_conditioning_cache_misses_total", "Conditioning cache lookups that had to prepare conditionals.",
+    lambda: conditioning_cache.stats()["misses"],
+)
+metrics.counter_fn(
+    "tts_conditioning_cache_evictions_total", "Conditionals evicted from the conditioning cache.",
+    lambda: conditioning_cache.stats()["evictions"],
+)
+metrics.gauge(
+    "tts_conditioning_cache_entries", "Conditionals held in the conditioning cache.",
+    lambda: conditioning_cache.stats()["entries"],
+)
+metrics.gauge(
+    "tts_conditioning_cache_bytes", "Bytes held in the conditioning cache.",
+    lambda: conditioning_cache.stats()["bytes"],
+)
+metrics.counter_fn(
+    "tts_audio_cache_hits_total", "Audio cache lookups served from memory or disk.",
+    lambda: audio_cache.stats()["hits"],
+)
+metrics.counter_fn(
+    "tts_audio_cache_disk_hits_total", "Audio cache lookups served from the disk tier.",
+    lambda: audio_cache.stats()["disk_hits"],
+)
+metrics.counter_fn(
+    "tts_audio_cache_misses_total", "Audio cache lookups that had to generate audio.",
+    lambda: audio_cache.stats()["misses"],
+)
+metrics.counter_fn(
+    "tts_audio_cache_evictions_total", "Chunks evicted from the in-memory audio cache.",
+    lambda: audio_cache.stats().get("evictions"),
+)
+metrics.gauge(
+    "tts_audio_cache_entries", "Chunks held in the in-memory audio cache.",
+    lambda: audio_cache.stats().get("entries"),
+)
+metrics.gauge(
+    "tts_audio_cache_bytes", "Bytes held in the in-memory audio cache.",
+    lambda: audio_cache.stats().get("bytes"),
+)
+metrics.gauge(
+    "tts_audio_cache_disk_bytes", "Bytes held in the on-disk audio cache.",
+    lambda: audio_cache.stats().get("disk_bytes"),
+)
+
+# Admission counters, read from the controller's stats() at scrape time
+metrics.counter_fn(
+    "tts_admission_admitted_total", "Requests admitted by admission control.",
+    lambda: admission.stats()["admitted"],
+)
+metrics.counter_fn(
+    "tts_admission_rejected_total", "Requests shed because the server was at capacity.",
+    lambda: admission.stats()["rejected"],
+)
+metrics.gauge(
+    "tts_admission_throughput", "Completed requests per second over the recent window.",
+    lambda: admission.stats()["throughput"],
+)
+
+# --- Helper Functions ---
+
+def prepare_conditionals(audio_bytes):
+    """
+    Blocking computation of speaker conditionals from reference audio bytes.
+    Runs on an inference worker thread.
+    """
+    return backend.prepare_conditionals(audio_bytes)
+
+async def load_conditionals(audio_bytes):
+    """
+    Return (voice_key, conditionals) for reference audio, computing and
+    caching the conditionals on a miss.
+    """
+    voice_key = hash_audio(audio_bytes)
+    conds = conditioning_cache.get(voice_key)
+    if conds is None:
+        with metrics.timed(metrics.REFERENCE_PREPROCESS):
+            conds = await inference.run(prepare_conditionals, audio_bytes)
+        conditioning_cache.put(voice_key, conds)
+    return voice_key, conds
+
+# Largest reference audio accepted, in bytes
+REFERENCE_MAX_BYTES = int(config.REFERENCE_MAX_MB * 1024 * 1024)
+
+class ReferenceUploadRoute(UploadRoute):
+    """Route whose form uploads are read in memory, up to TTS_REFERENCE_MAX_MB per file."""
+
+    max_file_bytes = REFERENCE_MAX_BYTES
+
+class AdmittedRoute(ReferenceUploadRoute):
+    """
+    Route that admits each request before its body is read, so a full server
+    sheds load without taking in uploads. The endpoint finds the Ticket in
+    request.state.ticket; it is released here if the endpoint raises.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def route_handler(request):
+            require_ready()
+            try:
+                ticket = admission.admit()
+            except Overloaded as e:
+                # The form (and its language) isn't read for rejected requests
+                metrics.REQUESTS.inc(endpoint=path, language="none", status="rejected")
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+            request.state.ticket = ticket
+            try:
+                return await handler(request)
+            except BaseException:
+                ticket.release()
+                raise
+
+        return route_handler
+
+async def load_uploaded_conditionals(upload):
+    """
+    load_conditionals for an uploaded reference clip, read in memory up to
+    TTS_REFERENCE_MAX_MB. Unusable audio raises HTTPException 400 (413 if
+    too large), and a full inference queue 429.
+    """
+    try:
+        return await load_conditionals(await read_upload(upload, REFERENCE_MAX_BYTES))
+    except ReferenceAudioError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def resolve_voice(voice_id):
+    """
+    Return (voice_id, conditionals) for a registered voice.
+    Raises KeyError if the voice_id is unknown.
+    """
+    conds = conditioning_cache.get(voice_id)
+    if conds is None:
+        conds = await asyncio.to_thread(voice_registry.load, voice_id)
+        conditioning_cache.put(voice_id, conds)
+    return voice_id, conds
+
+def request_flow(connection, priority_class=None):
+    """
+    Scheduling flow (client, priority class) of a request. The client is
+    the connection's X-API-Key, or its address without one. priority_class
+    (None for the default) is capped at the class of the API key, or at
+    TTS_DEFAULT_PRIORITY_CLASS. Raises ValueError for an unknown class.
+    """
+    known = isinstance(priority_class, str) and priority_class in config.PRIORITY_CLASSES
+    if priority_class is not None and not known:
+        raise ValueError(
+            f"Unknown priority_class: {priority_class} (expected one of {', '.join(config.PRIORITY_CLASSES)})"
+        )
+    api_key = connection.headers.get("x-api-key")
+    allowed = config.API_KEY_CLASSES.get(api_key, config.DEFAULT_PRIORITY_CLASS)
+    weight = config.PRIORITY_CLASSES.get
+    if priority_class is None or weight(priority_class, 1.0) > weight(allowed, 1.0):
+        priority_class = allowed
+    if api_key:
+        client = f"key:{api_key}"
+    else:
+        client = connection.client.host if connection.client else None
+    return client, priority_class
+
+def synthesize_batch(key, items):
+    """
+    Blocking TTS generation for a batch of (text, conditionals, cancel token,
+    generation session) items that share a language and voice. Runs on an
+    inference worker thread.
+    """
+    language, _ = key
+    conds = items[0][1]
+    texts = [text for text, _, _, _ in items]
+    cancels = [cancel for _, _, cancel, _ in items]
+    # Sessions hold state for the voice, which the whole batch shares
+    session = next((session for _, _, _, session in items if session is not None), None)
+    return backend.generate_batch(texts, language, conds, cancels, session=session)
+
+def cache_key(text, language, voice=None):
+    """
+    Audio cache key for text spoken in a (voice_key, conditionals) voice by
+    the current backend, with its generation settings.
+    """
+    return audio_cache_key(text, language, voice[0] if voice else None, backend.generation_params())
+
+async def cached_audio(key):
+    """Look up generated audio, off the event loop when the disk tier is on."""
+    if not audio_cache.enabled:
+        return None
+    if audio_cache.disk is None:
+        return audio_cache.get(key)
+    return await asyncio.to_thread(audio_cache.get, key)
+
+async def cache_audio(key, wav):
+    """Store generated audio, off the event loop when the disk tier is on."""
+    if not audio_cache.enabled:
+        return
+    if audio_cache.disk is None:
+        audio_cache.put(key, wav)
+    else:
+        await asyncio.to_thread(audio_cache.put, key, wav)
+
+async def synthesize(text, language, voice=None, deadline=None, cancel=None, session=None, flow=None):
+    """
+    Return the waveform for text, from the audio cache or by queueing it for
+    synthesis. voice is a (voice_key, conditionals) pair, or None for the
+    default voice, and session the backend's generation session for it.
+    flow is the request's scheduling flow (see request_flow).
+    Raises DeadlineExceeded if deadline passes while queued, and Cancelled
+    if the cancel token fires during generation.
+    """
+    key = cache_key(text, language, voice)
+    wav = await cached_audio(key)
+    if wav is not None:
+        return wav
+    voice_key, conds = voice if voice else (None, None)
+    timing = {}
+    try:
+        wav = await batcher.submit(
+            (language, voice_key), (text, conds, cancel, session), deadline, timing, flow=flow, cost=len(text)
+        )
+    finally:
+        if timing:
+            metrics.observe(metrics.QUEUE_WAIT, timing["queue_wait"])
+            metrics.observe(metrics.GENERATE, timing["generate"])
+    await cache_audio(key, wav)
+    return wav
+
+# Groups concurrent requests with the same language and voice into one batch
+batcher = BatchScheduler(
+    inference,
+    synthesize_batch,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    scheduler=scheduler,
+)
+
+# "chunked" generates whole text chunks; "incremental" streams token windows
+STREAM_MODES = ("chunked", "incremental")
+
+async def synthesize_incremental(text, language, voice=None, deadline=None, cancel=None, session=None, flow=None):
+    """
+    Stream waveform pieces for text as speech tokens are generated, instead
+    of waiting for the whole text.
+    """
+    conds = voice[1] if voice else None
+    # The whole chunk is one unit of scheduled work, like a chunk in a batch
+    slot = scheduler.slot(scheduler.tag(flow, len(text))) if scheduler is not None else None
+    submitted = time.monotonic()
+    started = []
+
+    def generate():
+        started.append(time.monotonic())
+        # Checked on the worker, so time spent waiting for it counts
+        if expired(deadline):
+            raise DeadlineExceeded()
+        windows = dict(
+            first_window_tokens=config.INCREMENTAL_FIRST_WINDOW_TOKENS,
+            window_tokens=config.INCREMENTAL_WINDOW_TOKENS,
+            context_tokens=config.INCREMENTAL_CONTEXT_TOKENS,
+            crossfade_ms=config.INCREMENTAL_CROSSFADE_MS,
+        )
+        yield from backend.generate_stream(text, language, conds, cancel, session=session, **windows)
+
+    last = None
+    async for wav_out in inference.stream(generate, slot=slot):
+        now = time.monotonic()
+        if last is None:
+            metrics.observe(metrics.QUEUE_WAIT, started[0] - submitted)
+            last = started[0]
+        # Per token window, the incremental counterpart of a chunk
+        metrics.observe(metrics.GENERATE, now - last)
+        last = now
+        yield wav_out
+
+def no_slot():
+    return contextlib.nullcontext()
+
+async def iter_audio(
+    text_chunks, language, voice, mode="chunked", deadline=None, cancel=None, slot=no_slot, flow=None,
+):
+    """
+    Yield (text_chunk, waveform) pairs for an utterance, one per text chunk in
+    "chunked" mode or one per token window in "incremental" mode. A failed
+    chunk yields its exception in place of the waveform.
+
+    Cached chunks are yielded whole in either mode; incremental chunks are
+    cached once all of their windows have been generated.
+
+    deadline bounds the wait for the first chunk's generation to start. If it
+    passes, DeadlineExceeded is yielded and the utterance ends, as it does
+    with Overloaded if the inference queue is full. Once the cancel
+    token fires, the current chunk stops at its next decoding step and the
+    utterance ends without yielding further chunks.
+
+    slot() returns an async context manager held while a chunk is generated,
+    used to order generation between utterances sharing a connection. Across
+    connections, each chunk waits for its turn under flow (see request_flow),
+    so a long utterance doesn't hold up other clients' short ones.
+
+    The chunks of a multi-chunk utterance share a backend generation session,
+    closed when the utterance ends, so per-voice work such as the model's
+    conditioning prefix is done once rather than per chunk.
+    """
+    session = backend.open_session(voice[1] if voice else None) if len(text_chunks) > 1 else None
+    try:
+        for index, chunk in enumerate(text_chunks):
+            if cancel is not None and cancel.cancelled:
+                return
+            chunk_deadline = deadline if index == 0 else None
+            if mode == "incremental":
+                key = cache_key(chunk, language, voice)
+                wav_out = await cached_audio(key)
+                if wav_out is not None:
+                    yield chunk, wav_out
+                    continue
+                pieces = []
+                try:
+                    async with slot():
+                        async for wav_out in synthesize_incremental(
+                            chunk, language, voice, chunk_deadline, cancel, session, flow
+                        ):
+                            pieces.append(wav_out)
+                            yield chunk, wav_out
+                except Cancelled:
+                    return
+                except (DeadlineExceeded, Overloaded) as e:
+                    yield chunk, e
+                    return
+                except Exception as e:
+                    yield chunk, e
+                    continue
+                if pieces:
+                    await cache_audio(key, torch.cat(pieces, dim=-1))
+            else:
+                try:
+                    async with slot():
+                        wav_out = await synthesize(chunk, language, voice, chunk_deadline, cancel, session, flow)
+                except Cancelled:
+                    return
+                except (DeadlineExceeded, Overloaded) as e:
+                    yield chunk, e
+                    return
+                except Exception as e:
+                    wav_out = e
+                yield chunk, wav_out
+    finally:
+        if session is not None:
+            session.close()
+
+def chunk_text(text, language="en"):
+    """
+    Split text into generation chunks using the language-aware segmenter.
+    """
+    return segment_text(
+        text,
+        language,
+        max_chunk_size=config.CHUNK_MAX_CHARS,
+        first_chunk_size=config.CHUNK_FIRST_MAX_CHARS,
+        min_chunk_size=config.CHUNK_MIN_CHARS,
+    )
+
+def encode_chunk(wav_out, chunk_index, total_chunks, text_chunk, is_final, binary, sample_format, channel, encoder=None):
+    """
+    Encode one generated chunk for /tts-stream: a binary PCM frame, or a JSON
+    message carrying a base64 WAV. Returns a bytes-like object or str
+    respectively; frames are built in place around the converted samples.
+    A wav_out of None encodes an empty end-of-stream chunk. Frames and
+    messages are tagged with the channel's stream_id and request_id.
+
+    With an encoder (the request's "format"), each chunk instead carries the
+    next slice of one continuous encoded stream, and the final chunk the
+    encoder's remaining output.
+    """
+    if encoder is not None:
+        data = encoder.encode(wav_out) if wav_out is not None else b""
+        if is_final:
+            data = b"".join((data, encoder.finish()))
+        if binary:
+            sample_count = wav_out.shape[-1] * encoder.output_rate // sample_rate if wav_out is not None else 0
+            return audio_protocol.pack_encoded_frame(chunk_index, data, sample_count, is_final, channel.stream_id)
+        audio_b64 = base64.b64encode(data).decode('utf-8')
+    elif binary:
+        sample_count = wav_out.numel() if wav_out is not None else 0
+        header = audio_protocol.pack_header(chunk_index, sample_count, is_final, sample_format, channel.stream_id)
+        return pcm_buffer(wav_out, sample_format, header) if wav_out is not None else header
+    elif wav_out is not None:
+        audio_b64 = base64.b64encode(wav_buffer(wav_out, sample_rate)).decode('ascii')
+    else:
+        audio_b64 = ""
+    return json.dumps(channel.tag({
+        "type": "audio_chunk",
+        "chunk_index": chunk_index,
+        "total_chunks": total_chunks,
+        "audio_data": audio_b64,
+        "text_chunk": text_chunk,
+        "is_final": is_final
+    }))
+
+class StreamChannel:
+    """
+    One utterance's view of a /tts-stream connection. Several utterances can
+    share a socket, so messages are tagged with the request_id (JSON) or
+    stream_id (binary frames) and sends are serialized by a shared lock.
+    """
+
+    def __init__(self, websocket, send_lock, request_id=None, stream_id=0):
+        self.websocket = websocket
+        self.send_lock = send_lock
+        self.request_id = request_id
+        self.stream_id = stream_id
+
+    @property
+    def connected(self):
+        return self.websocket.client_state.name == "CONNECTED"
+
+    def tag(self, message):
+        """Add the request_id to a JSON message dict, if the request has one."""
+        if self.request_id is not None:
+            message["request_id"] = self.request_id
+        return message
+
+    async def send_json(self, message):
+        await self.send_text(json.dumps(self.tag(message)))
+
+    async def send_text(self, text):
+        async with self.send_lock:
+            await self.websocket.send_text(text)
+
+    async def send_bytes(self, data):
+        async with self.send_lock:
+            await self.websocket.send_bytes(data)
+
+async def stream_chunks(
+    channel, text_chunks, language, voice, binary, sample_format, mode="chunked", deadline=None, cancel=None,
+    slot=no_slot, encoder=None, flow=None,
+):
+    """
+    Generate and send the chunks of one utterance as a two-stage pipeline.
+    The producer starts generating chunk i+1 as soon as chunk i is ready,
+    while the consumer encodes and sends. A bounded queue between the two
+    applies backpressure when the client reads slower than we generate.
+
+    Once cancel fires, chunks that are already generated are dropped and the
+    chunk being generated stops at its next decoding step. The cancel token
+    is also fired if the stream stops early for any other reason.
+
+    channel is the StreamChannel the utterance's messages are sent on,
+    encoder the utterance's StreamEncoder if it asked for a "format", and
+    flow its scheduling flow.
+    """
+    # The number of audio pieces is only known up front in chunked mode
+    total_chunks = len(text_chunks) if mode == "chunked" else None
+    generated = asyncio.Queue(maxsize=config.STREAM_PIPELINE_DEPTH)
+
+    async def produce():
+        index = 0
+        try:
+            async for chunk, wav_out in iter_audio(text_chunks, language, voice, mode, deadline, cancel, slot, flow):
+                # Check if connection is still alive
+                if not channel.connected:
+                    print(f"Client disconnected during chunk {index}")
+                    break
+                if cancel is not None and cancel.cancelled:
+                    break
+                is_final = total_chunks is not None and index == total_chunks - 1
+                await generated.put((index, chunk, wav_out, is_final))
+                index += 1
+            else:
+                if total_chunks is None and not (cancel is not None and cancel.cancelled):
+                    # Piece count isn't known in advance; close with an empty final chunk
+                    await generated.put((index, "", None, True))
+        except Exception as e:
+            # Failures outside iter_audio's per-chunk handling (e.g. opening
+            # the generation session) go to the consumer, which raises them
+            await generated.put(e)
+        await generated.put(None)
+
+    request_metrics = metrics.current()
+    producer = asyncio.create_task(produce())
+    completed = False
+    try:
+        while True:
+            item = await generated.get()
+            if item is None:
+                completed = True
+                break
+            if isinstance(item, Exception):
+                raise item
+            if cancel is not None and cancel.cancelled:
+                break
+            i, chunk, wav_out, is_final = item
+
+            if isinstance(wav_out, (DeadlineExceeded, Overloaded)):
+                await channel.send_json({
+                    "type": "error",
+                    "code": 429 if isinstance(wav_out, Overloaded) else 503,
+                    "chunk_index": i,
+                    "error": str(wav_out),
+                    "retry_after": admission.retry_after(admission.active),
+                })
+                continue
+
+            if isinstance(wav_out, Exception):
+                await channel.send_json({
+                    "type": "error",
+                    "chunk_index": i,
+                    "error": f"Failed to process chunk {i}: {str(wav_out)}"
+                })
+                continue
+
+            try:
+                with metrics.timed(metrics.ENCODE):
+                    message = await asyncio.to_thread(
+                        encode_chunk, wav_out, i, total_chunks, chunk, is_final, binary, sample_format, channel, encoder
+                    )
+            except Exception as audio_error:
+                print(f"Audio encoding error for chunk {i}: {audio_error}")
+                await channel.send_json({
+                    "type": "error",
+                    "chunk_index": i,
+                    "error": f"Audio encoding failed: {str(audio_error)}"
+                })
+                continue
+
+            try:
+                with metrics.timed(metrics.SEND):
+                    if binary:
+                        await channel.send_bytes(message)
+                    else:
+                        await channel.send_text(message)
+                if request_metrics is not None and wav_out is not None:
+                    request_metrics.add_audio(wav_out.shape[-1], sample_rate)
+                    request_metrics.first_chunk()
+                print(f"Sent chunk {i+1}/{total_chunks or '?'} to client")
+            except Exception as send_error:
+                print(f"Failed to send chunk {i}: {send_error}")
+                break
+    finally:
+        if cancel is not None and not completed:
+            # Stop the chunk that is still generating, not just the producer task
+            cancel.cancel("stream stopped")
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+
+async def prefetch(items, depth):
+    """
+    Iterate an async iterator ahead of its consumer, buffering up to depth
+    items, so the next chunk is generated while the current one is sent.
+    """
+    buffered = asyncio.Queue(maxsize=depth)
+    done = object()
+
+    async def fill():
+        try:
+            async for item in items:
+                await buffered.put((item, None))
+        except Exception as e:
+            await buffered.put((done, e))
+            return
+        await buffered.put((done, None))
+
+    filler = asyncio.create_task(fill())
+    try:
+        while True:
+            item, error = await buffered.get()
+            if error is not None:
+                raise error
+            if item is done:
+                break
+            yield item
+    finally:
+        filler.cancel()
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that awaits close() however the response ends. A
+    background task doesn't run if sending fails, and a body iterator that
+    never started doesn't run its finally, so a client that hangs up before
+    the body starts would otherwise leave generation running.
+    """
+
+    def __init__(self, content, close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.close = close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await self.close()
+
+async def stream_audio(first, pieces, encoder, ticket, cancel, request_metrics):
+    """
+    Yield the audio for a streaming HTTP response, encoded by encoder as one
+    continuous stream (a WAV header with streaming placeholder sizes, Ogg
+    pages, ...). first is the already generated first (chunk, waveform) pair
+    and pieces iterates the rest; each is flushed as soon as it's generated.
+    The admission ticket is released when the stream ends, and the cancel
+    token fired so generation stops if the client hung up part way.
+    """
+    status = "cancelled"
+    try:
+        piece = first
+        while piece is not None:
+            chunk, wav_out = piece
+            if isinstance(wav_out, Exception):
+                # Headers are already sent, so the status can't change; end the stream
+                print(f"Failed to process chunk '{chunk[:50]}': {wav_out}")
+                status = "error"
+                return
+            start = time.perf_counter()
+            # Compressed formats take a while to encode; keep the event loop free
+            data = await asyncio.to_thread(encoder.encode, wav_out)
+            encoded = time.perf_counter()
+            request_metrics.observe(metrics.ENCODE, encoded - start)
+            if data:
+                yield data
+            # The body iterator resumes once the chunk has been sent
+            request_metrics.observe(metrics.SEND, time.perf_counter() - encoded)
+            request_metrics.add_audio(wav_out.shape[-1], sample_rate)
+            request_metrics.first_chunk()
+            piece = await anext(pieces, None)
+        data = await asyncio.to_thread(encoder.finish)
+        if data:
+            yield data
+        status = "ok"
+    finally:
+        request_metrics.finish(status)
+        cancel.cancel("response closed")
+        await pieces.aclose()
+        ticket.release()
+
+def new_cancel_token():
+    """Cancel token for one request, with the hard duration limit if configured."""
+    if config.REQUEST_MAX_S > 0:
+        return CancelToken(deadline=time.monotonic() + config.REQUEST_MAX_S)
+    return CancelToken()
+
+async def cancel_on_disconnect(request, cancel, interval=0.25):
+    """Fire cancel once the HTTP client disconnects."""
+    while not cancel.cancelled:
+        if await request.is_disconnected():
+            print("HTTP client disconnected, cancelling generation")
+            cancel.cancel("client disconnected")
+            return
+        await asyncio.sleep(interval)
+
+async def watch_disconnect(request, cancel, awaitable):
+    """Await awaitable while cancelling generation if the client goes away."""
+    watcher = asyncio.create_task(cancel_on_disconnect(request, cancel))
+    try:
+        return await awaitable
+    finally:
+        watcher.cancel()
+
+def parse_output_rate(value):
+    """Validate a requested output sample rate (None keeps the format's default)."""
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or not 8000 <= value <= 48000:
+        raise ValueError(f"Unsupported sample_rate: {value} (8000 to 48000 Hz)")
+    return value
 
 # --- FastAPI Application ---
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Loading runs in the background so /health/live answers right away
+    loading = asyncio.create_task(start_model())
+    yield
+    loading.cancel()
+    inference.shutdown(wait=False)
+    if backend is not None:
+        backend.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+# Read form uploads in memory, with size limits (see uploads.py)
+app.router.route_class = ReferenceUploadRoute
+
+def require_ready():
+    """Reject requests with 503 until the model is loaded and warmed up."""
+    if not ready():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model is not ready ({startup['status']})",
+            headers={"Retry-After": "5"},
+        )
 
 # --- API Endpoints ---
 
-@app.post("/tts")
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latencies by endpoint and language, plus load gauges."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the process is up. Fails only if the model could not be loaded."""
+    if startup["status"] == "failed":
+        raise HTTPException(status_code=503, detail=startup["error"])
+    return {"status": startup["status"]}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: the model is loaded and warmed up, so requests are served at full speed."""
+    if not ready():
+        raise HTTPException(status_code=503, detail=startup["status"], headers={"Retry-After": "5"})
+    return {"status": "ready", "active_requests": admission.active}
+
+@app.post("/voices")
+async def register_voice(
+    reference_audio: UploadFile = File(...),
+    name: str = Form(None),
+):
+    """
+    Upload a reference voice once. Its conditionals are precomputed, saved to
+    disk and can then be used via voice_id in /tts and /tts-stream.
+    """
+    require_ready()
+    voice_id, conds = await load_uploaded_conditionals(reference_audio)
+    if voice_registry.exists(voice_id):
+        return voice_registry.metadata(voice_id)
+    return await asyncio.to_thread(voice_registry.save, voice_id, conds, name)
+
+@app.get("/voices")
+async def list_voices():
+    """List all registered voices."""
+    return {"voices": await asyncio.to_thread(voice_registry.list)}
+
+@app.delete("/voices/{voice_id}")
+async def delete_voice(voice_id: str):
+    """Remove a registered voice."""
+    try:
+        await asyncio.to_thread(voice_registry.delete, voice_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown voice_id: {voice_id}")
+    conditioning_cache.discard(voice_id)
+    return {"voice_id": voice_id, "deleted": True}
+
+# Routes admitted before their body is read (see AdmittedRoute)
+admitted_router = APIRouter(route_class=AdmittedRoute)
+
+@admitted_router.post("/tts")
 async def generate_tts(
+    request: Request,
     text: str = Form(...),
     language: str = Form("en"),
     reference_audio: UploadFile = File(None),  # Reference audio is now optional
+    voice_id: str = Form(None),
+    mode: str = Form("full"),
+    stream: bool = Form(False),
+    output_format: str = Form("wav", alias="format"),
+    output_rate: int = Form(None, alias="sample_rate"),
+    timeout: float = Form(None),
+    priority_class: str = Form(None),
 ):
     """
     A single endpoint for both standard TTS and voice cloning.
     - If only text and language are provided, it performs standard TTS.
     - If reference_audio is also uploaded, it performs voice cloning.
+    - If voice_id is given, it clones a voice registered via POST /voices.
+    - stream=true splits the text into chunks like /tts-stream and sends each
+      chunk's audio with chunked transfer encoding as soon as it's generated.
+    - mode="incremental" streams as speech tokens are generated (implies stream).
+    - format selects the audio format: "wav" (default), "pcm" (raw 16-bit
+      mono), "flac", "opus" (Ogg/Opus), "mp3" or "mulaw" (8 kHz G.711).
+      sample_rate resamples the output on the server.
+    - timeout (seconds) shortens the server's request deadline. Requests are
+      rejected with 429 when the server is full and 503 when the deadline
+      passes before generation starts, both with a Retry-After estimate.
+    - Generation stops at the next decoding step if the client disconnects.
+    - priority_class ("interactive" or "bulk" by default) sets the request's
+      share of generation time; an X-API-Key header can cap it.
     """
-    audio_prompt_path = None
-    temp_file_handle = None
+    # Admitted by AdmittedRoute before the form was read
+    ticket = request.state.ticket
+    ticket.shorten(timeout)
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail=f"Unsupported mode: {mode}")
+    try:
+        encoder = create_encoder(output_format, sample_rate, parse_output_rate(output_rate))
+        flow = request_flow(request, priority_class)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    cancel = new_cancel_token()
+    request_metrics = metrics.start_request("/tts", language, ticket.admitted_at)
+    streaming = False
     try:
-        # If a reference audio file is provided, save it to a temporary file
+        voice = None
+
+        # If a reference audio file is provided, load (or reuse) its conditionals
         if reference_audio:
-            # Create a temporary file to avoid race conditions
-            temp_file_handle, audio_prompt_path = tempfile.mkstemp(suffix=".wav")
-            with open(audio_prompt_path, "wb") as f:
-                f.write(await reference_audio.read())
+            voice = await load_uploaded_conditionals(reference_audio)
+        elif voice_id:
+            try:
+                voice = await resolve_voice(voice_id)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Unknown voice_id: {voice_id}")
+
+        # Determine the correct filename and headers for the output file
+        output_filename = ("voiceclone_output" if voice else "tts_output") + f".{output_format}"
+        media_type = encoder.content_type
+        headers = {
+            "Content-Disposition": f"attachment; filename={output_filename}",
+            "X-Sample-Rate": str(encoder.output_rate),
+        }
+
+        if stream or mode == "incremental":
+            stream_mode = "incremental" if mode == "incremental" else "chunked"
+            pieces = prefetch(
+                iter_audio(chunk_text(text, language), language, voice, stream_mode, ticket.deadline, cancel, flow=flow),
+                config.STREAM_PIPELINE_DEPTH,
+            )
+            # Wait for the first chunk before sending headers, so a request
+            # that expires in the queue still gets a 503
+            first = await watch_disconnect(request, cancel, anext(pieces, None))
+            if cancel.cancelled:
+                await pieces.aclose()
+                raise Cancelled(cancel.reason)
+            if first is not None and isinstance(first[1], Exception):
+                await pieces.aclose()
+                raise first[1]
+            streaming = True
+
+            async def close_stream():
+                # Nothing to do if stream_audio already ended the stream
+                request_metrics.finish("cancelled")
+                cancel.cancel("response closed")
+                await pieces.aclose()
+                ticket.release()
 
-        # Generate TTS audio. If audio_prompt_path is None, it's standard TTS.
+            return ClosingStreamingResponse(
+                stream_audio(first, pieces, encoder, ticket, cancel, request_metrics),
+                close_stream,
+                media_type=media_type,
+                headers=headers,
+            )
+
+        # Generate TTS audio. If voice is None, it's standard TTS.
         # Otherwise, it's voice cloning.
-        wav_out = tts_model.generate(
-            text,
-            language_id=language,
-            audio_prompt_path=audio_prompt_path
+        wav_out = await watch_disconnect(
+            request, cancel, synthesize(text, language, voice, ticket.deadline, cancel, flow=flow)
         )
+    except DeadlineExceeded as e:
+        request_metrics.finish("deadline_exceeded")
+        retry_after = admission.retry_after(admission.active)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+    except Overloaded as e:
+        # The inference queue was full
+        request_metrics.finish("rejected")
+        retry_after = admission.retry_after(admission.active)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(retry_after)})
+    except Cancelled as e:
+        request_metrics.finish("cancelled")
+        # 504 when TTS_REQUEST_MAX_S ran out; otherwise the client has gone
+        # away and the status is only for logs and proxies
+        status_code = 504 if cancel.reason is None else 499
+        raise HTTPException(status_code=status_code, detail=f"Request cancelled: {e}")
+    except Exception:
+        request_metrics.finish("error")
+        raise
+    finally:
+        if not streaming:
+            cancel.cancel("request finished")
+            ticket.release()
 
-        # Save the generated audio into an in-memory buffer
-        buffer = io.BytesIO()
-        ta.save(buffer, wav_out, tts_model.sr, format="wav")
-        buffer.seek(0)
+    # Encode the generated audio; the buffer is sent without another copy
+    with metrics.timed(metrics.ENCODE):
+        content = await asyncio.to_thread(encoder.encode_all, wav_out)
+    request_metrics.add_audio(wav_out.shape[-1], sample_rate)
+    # The whole file is the first (and only) chunk
+    request_metrics.first_chunk()
+    request_metrics.finish("ok")
 
-        # Determine the correct filename for the output file
-        output_filename = "voiceclone_output.wav" if reference_audio else "tts_output.wav"
+    return Response(
+        content,
+        media_type=media_type,
+        headers=headers
+    )
 
-        # Return the audio as a streaming response
-        return StreamingResponse(
-            buffer,
-            media_type="audio/wav",
-            headers={"Content-Disposition": f"attachment; filename={output_filename}"}
-        )
+app.include_router(admitted_router)
+
+async def handle_stream_request(channel, request_data, cancel, slot=no_slot, previous=None):
+    """
+    Validate, admit and stream one /tts-stream request. Runs as its own task
+    so several requests can be in flight on one connection. previous is a
+    task to wait for first, which keeps untagged requests sequential.
+    """
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+
+    text = request_data.get("text", "")
+    language = request_data.get("language", "en")
+    reference_audio_b64 = request_data.get("reference_audio")
+    voice_id = request_data.get("voice_id")
+    binary = bool(request_data.get("binary", False))
+    sample_format = request_data.get("sample_format", "int16")
+    output_format = request_data.get("format")
+    output_rate = request_data.get("sample_rate")
+    mode = request_data.get("mode", "chunked")
+    timeout = request_data.get("timeout")
+    priority_class = request_data.get("priority_class")
+    voice = None
+
+    if cancel.cancelled:
+        await channel.send_json({"type": "cancelled", "reason": cancel.reason})
+        return
+
+    if not text:
+        await channel.send_json({
+            "type": "error",
+            "error": "Text is required"
+        })
+        return
+
+    if binary and sample_format not in audio_protocol.SAMPLE_FORMATS:
+        await channel.send_json({
+            "type": "error",
+            "error": f"Unsupported sample_format: {sample_format}"
+        })
+        return
+
+    if mode not in STREAM_MODES:
+        await channel.send_json({
+            "type": "error",
+            "error": f"Unsupported mode: {mode}"
+        })
+        return
+
+    if timeout is not None and not isinstance(timeout, (int, float)):
+        await channel.send_json({
+            "type": "error",
+            "error": f"Invalid timeout: {timeout}"
+        })
+        return
+
+    try:
+        flow = request_flow(channel.websocket, priority_class)
+    except ValueError as e:
+        await channel.send_json({
+            "type": "error",
+            "error": str(e)
+        })
+        return
+
+    if not ready():
+        await channel.send_json({
+            "type": "error",
+            "code": 503,
+            "error": f"Model is not ready ({startup['status']})",
+            "retry_after": 5,
+        })
+        return
 
+    # With a "format" (or "sample_rate") the utterance is sent as one
+    # continuous encoded stream instead of independent chunks
+    encoder = None
+    if output_format is not None or output_rate is not None:
+        output_format = output_format or ("pcm" if binary else "wav")
+        try:
+            encoder = create_encoder(output_format, sample_rate, parse_output_rate(output_rate))
+        except ValueError as e:
+            await channel.send_json({
+                "type": "error",
+                "error": str(e)
+            })
+            return
+
+    # Each message is admitted separately, before its audio is decoded
+    try:
+        ticket = admission.admit(timeout)
+    except Overloaded as e:
+        metrics.REQUESTS.inc(endpoint="/tts-stream", language=metrics.language_label(language), status="rejected")
+        await channel.send_json({
+            "type": "error",
+            "code": 429,
+            "error": str(e),
+            "retry_after": e.retry_after,
+        })
+        return
+
+    request_metrics = metrics.start_request("/tts-stream", language, ticket.admitted_at)
+    status = "error"
+    try:
+        # Handle reference audio if provided
+        if reference_audio_b64:
+            try:
+                # Check the size before decoding the base64 audio data
+                check_size(decode_base64_size(reference_audio_b64), REFERENCE_MAX_BYTES)
+                audio_data = base64.b64decode(reference_audio_b64)
+                voice = await load_conditionals(audio_data)
+            except Exception as e:
+                error = {
+                    "type": "error",
+                    "error": f"Failed to process reference audio: {str(e)}"
+                }
+                if isinstance(e, ReferenceAudioError):
+                    error["code"] = e.status_code
+                elif isinstance(e, Overloaded):
+                    error.update(code=429, retry_after=e.retry_after)
+                await channel.send_json(error)
+                return
+        elif voice_id:
+            try:
+                voice = await resolve_voice(voice_id)
+            except KeyError:
+                await channel.send_json({
+                    "type": "error",
+                    "error": f"Unknown voice_id: {voice_id}"
+                })
+                return
+
+        # Split text into chunks
+        text_chunks = chunk_text(text, language)
+        total_chunks = len(text_chunks) if mode == "chunked" else None
+
+        # Send total chunks info
+        info = {
+            "type": "info",
+            "mode": mode,
+            "total_chunks": total_chunks,
+            "priority_class": flow[1],
+            "message": f"Processing {len(text_chunks)} text chunks..."
+        }
+        if encoder is not None:
+            info.update({
+                "format": output_format,
+                "content_type": encoder.content_type,
+                "sample_rate": encoder.output_rate,
+                "channels": 1,
+            })
+        elif binary:
+            info.update({
+                "encoding": "pcm",
+                "sample_format": sample_format,
+                "sample_rate": sample_rate,
+                "channels": 1,
+            })
+        if binary and channel.request_id is not None:
+            info["stream_id"] = channel.stream_id
+        await channel.send_json(info)
+
+        # Generate and send the chunks through a producer/consumer pipeline
+        await stream_chunks(
+            channel, text_chunks, language, voice, binary, sample_format, mode, ticket.deadline, cancel, slot, encoder,
+            flow,
+        )
+        status = "cancelled" if cancel.cancelled else "ok"
+        if cancel.cancelled and channel.connected:
+            await channel.send_json({
+                "type": "cancelled",
+                "reason": cancel.reason or "request deadline exceeded",
+            })
+    except Exception as e:
+        print(f"Stream request failed: {e}")
+        if channel.connected:
+            await channel.send_json({
+                "type": "error",
+                "error": f"Generation failed: {str(e)}"
+            })
     finally:
-        # Cleanup: ensure the temporary file is deleted after the request is complete
-        if audio_prompt_path and os.path.exists(audio_prompt_path):
-            os.close(temp_file_handle)
-            os.remove(audio_prompt_path)
+        request_metrics.finish(status)
+        ticket.release()
 
 @app.websocket("/tts-stream")
 async def tts_stream(websocket: WebSocket):
     """
     WebSocket endpoint for streaming TTS generation.
     Client sends: {"text": "...", "language": "en", "reference_audio": "base64_encoded_wav_data"}
+                  or {"text": "...", "language": "en", "voice_id": "..."}
     Server responds with chunks: {"chunk_index": 0, "audio_data": "base64_encoded_wav", "is_final": false}
+
+    If the request sets "binary": true, audio chunks are instead sent as binary
+    frames of raw PCM ("sample_format": "int16" or "float32") with the header
+    defined in audio_protocol.py. The info message then carries the sample
+    rate and format.
+
+    "format" ("pcm", "wav", "flac", "opus", "mp3" or "mulaw") and/or
+    "sample_rate" send the utterance as one continuous encoded stream
+    instead: each chunk's audio_data (or binary frame, flagged encoded)
+    holds the next slice of it, and joining them gives one file. The info
+    message carries the format, content_type and sample_rate.
+
+    "mode": "incremental" streams audio as speech tokens are generated, in
+    short token windows instead of whole sentences. The number of chunks
+    isn't known in advance, so total_chunks is null and the stream ends
+    with an empty chunk flagged is_final.
+
+    Each message is admitted like a /tts request. When the server is full
+    the message is rejected with an error carrying "code": 429 and
+    "retry_after"; if its deadline ("timeout" in seconds, optional) passes
+    before generation starts, the error carries "code": 503.
+
+    A request with a "request_id" runs concurrently with the connection's
+    other requests: every JSON message for it carries the request_id, and
+    its binary frames carry the stream_id announced in its info message.
+    Chunks of concurrent requests are interleaved, and "priority" (higher
+    first, default 0) decides whose next chunk is generated first. Requests
+    without a request_id are handled one after another, as before.
+
+    Between connections, chunks are scheduled fairly by client (the
+    X-API-Key header of the handshake, or the client address) and
+    "priority_class", as for /tts.
+
+    {"type": "cancel"} stops every utterance on the connection, or only one
+    with {"type": "cancel", "request_id": ...}: generation stops at the next
+    decoding step, no further chunks are sent, and the server replies
+    {"type": "cancelled"}. A client disconnect cancels everything.
     """
     await websocket.accept()
-    audio_prompt_path = None
-    temp_file_handle = None
-    
+
+    send_lock = asyncio.Lock()
+    # Generation order between this connection's requests
+    gate = PriorityLimiter(config.STREAM_CONNECTION_CONCURRENCY)
+    # key -> (task, cancel token); untagged requests use a unique object as key
+    active = {}
+    stream_ids = itertools.count()
+    untagged = None
+
+    async def send_error(message, request_id=None):
+        await StreamChannel(websocket, send_lock, request_id).send_json({"type": "error", "error": message})
+
     try:
         while True:
-            # Receive message from client
+            # Receive message from client. Requests run as tasks, so this loop
+            # keeps reading cancel messages while audio is streaming.
             data = await websocket.receive_text()
             request_data = json.loads(data)
-            
-            text = request_data.get("text", "")
-            language = request_data.get("language", "en")
-            reference_audio_b64 = request_data.get("reference_audio")
-            
-            if not text:
-                await websocket.send_text(json.dumps({
-                    "error": "Text is required"
-                }))
+            request_id = request_data.get("request_id")
+
+            if request_data.get("type") == "cancel":
+                for key, (_, cancel) in list(active.items()):
+                    if request_id is None or key == request_id:
+                        cancel.cancel("client cancelled")
                 continue
-            
-            # Handle reference audio if provided
-            if reference_audio_b64:
-                try:
-                    # Decode base64 audio data
-                    audio_data = base64.b64decode(reference_audio_b64)
-                    temp_file_handle, audio_prompt_path = tempfile.mkstemp(suffix=".wav")
-                    with open(audio_prompt_path, "wb") as f:
-                        f.write(audio_data)
-                except Exception as e:
-                    await websocket.send_text(json.dumps({
-                        "error": f"Failed to process reference audio: {str(e)}"
-                    }))
-                    continue
-            
-            # Split text into chunks
-            text_chunks = chunk_text(text)
-            total_chunks = len(text_chunks)
-            
-            # Send total chunks info
-            await websocket.send_text(json.dumps({
-                "type": "info",
-                "total_chunks": total_chunks,
-                "message": f"Processing {total_chunks} chunks..."
-            }))
-            
-            # Process each chunk
-            for i, chunk in enumerate(text_chunks):
-                try:
-                    # Check if connection is still alive
-                    if websocket.client_state.name != "CONNECTED":
-                        print(f"Client disconnected during chunk {i}")
-                        break
-                    
-                    # Generate TTS for this chunk
-                    wav_out = tts_model.generate(
-                        chunk,
-                        language_id=language,
-                        audio_prompt_path=audio_prompt_path
-                    )
-                    
-                    # Convert audio to base64 with better error handling
-                    buffer = io.BytesIO()
-                    try:
-                        ta.save(buffer, wav_out, tts_model.sr, format="wav")
-                        buffer.seek(0)
-                        audio_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                    except Exception as audio_error:
-                        print(f"Audio encoding error for chunk {i}: {audio_error}")
-                        await websocket.send_text(json.dumps({
-                            "type": "error",
-                            "chunk_index": i,
-                            "error": f"Audio encoding failed: {str(audio_error)}"
-                        }))
-                        continue
-                    
-                    # Send chunk to client with connection check
-                    response = {
-                        "type": "audio_chunk",
-                        "chunk_index": i,
-                        "total_chunks": total_chunks,
-                        "audio_data": audio_b64,
-                        "text_chunk": chunk,
-                        "is_final": i == total_chunks - 1
-                    }
-                    
-                    try:
-                        await websocket.send_text(json.dumps(response))
-                        print(f"Sent chunk {i+1}/{total_chunks} to client")
-                    except Exception as send_error:
-                        print(f"Failed to send chunk {i}: {send_error}")
-                        break
-                    
-                except Exception as e:
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "chunk_index": i,
-                        "error": f"Failed to process chunk {i}: {str(e)}"
-                    }))
-            
-            # Cleanup reference audio file after processing
-            if audio_prompt_path and os.path.exists(audio_prompt_path):
-                os.close(temp_file_handle)
-                os.remove(audio_prompt_path)
-                audio_prompt_path = None
-                temp_file_handle = None
-                
+
+            if request_id is not None and (not isinstance(request_id, (str, int)) or request_id in active):
+                await send_error(f"Invalid or duplicate request_id: {request_id}", request_id)
+                continue
+
+            if len(active) >= config.STREAM_MAX_REQUESTS_PER_CONNECTION:
+                await send_error(
+                    f"Too many requests in flight on this connection (max {config.STREAM_MAX_REQUESTS_PER_CONNECTION})",
+                    request_id,
+                )
+                continue
+
+            priority = request_data.get("priority", 0)
+            if not isinstance(priority, (int, float)):
+                await send_error(f"Invalid priority: {priority}", request_id)
+                continue
+
+            stream_id = 0
+            if request_id is not None:
+                # Binary frames carry a 16-bit stream id; 0 means untagged
+                stream_id = next(stream_ids) % 0xFFFF + 1
+            channel = StreamChannel(websocket, send_lock, request_id, stream_id)
+            cancel = new_cancel_token()
+            task = asyncio.create_task(handle_stream_request(
+                channel,
+                request_data,
+                cancel,
+                slot=lambda priority=priority: gate.slot(priority),
+                previous=untagged if request_id is None else None,
+            ))
+            key = request_id if request_id is not None else object()
+            active[key] = (task, cancel)
+            task.add_done_callback(lambda _, key=key: active.pop(key, None))
+            if request_id is None:
+                untagged = task
+
     except WebSocketDisconnect:
         print("Client disconnected")
     except Exception as e:
         print(f"WebSocket error: {e}")
         try:
-            await websocket.send_text(json.dumps({
-                "type": "error",
-                "error": str(e)
-            }))
+            await send_error(str(e))
         except:
             pass
     finally:
-        # Final cleanup
-        if audio_prompt_path and os.path.exists(audio_prompt_path):
-            try:
-                os.close(temp_file_handle)
-                os.remove(audio_prompt_path)
-            except:
-                pass
\ No newline at end of file
+        tasks = []
+        for task, cancel in list(active.values()):
+            cancel.cancel("client disconnected")
+            tasks.append(task)
+        # Let requests notice the cancellation and release their resources
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Stream request failed: {result}")
@@ -0,0 +1,190 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+
+import torch
+
+from conditioning import ConditioningCache
+
+def normalize_text(text):
+    """Canonical form of text for cache lookups: NFC with collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def audio_cache_key(text, language, voice_key=None, params=None):
+    """
+    Content-addressed key for generated audio: normalized text, language,
+    voice hash (None for the model's default voice) and generation parameters.
+    """
+    payload = json.dumps(
+        {
+            "text": normalize_text(text),
+            "language": (language or "").lower(),
+            "voice": voice_key,
+            "params": params or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class DiskAudioStore:
+    """
+    Size-bounded on-disk store of waveforms, one <key>.pt file per entry.
+    File modification times track recency: a hit touches the file, and the
+    least recently used files are removed once max_bytes is exceeded.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pt")
+
+    def _files(self):
+        """(mtime, path, size) for every stored entry."""
+        files = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".pt"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        return files
+
+    def get(self, key):
+        """Load the waveform stored under key, or None if absent or unreadable."""
+        path = self._path(key)
+        try:
+            wav = torch.load(path, map_location="cpu", weights_only=True)
+            os.utime(path)
+            return wav
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Discarding unreadable cached audio {path}: {e}")
+            self.discard(key)
+            return None
+
+    def put(self, key, wav):
+        """Write wav under key, then trim the store back under max_bytes."""
+        path = self._path(key)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                return
+            # Write to a temporary path first so readers never see a partial file
+            try:
+                torch.save(wav, path + ".tmp")
+                os.replace(path + ".tmp", path)
+            except Exception:
+                with contextlib.suppress(OSError):
+                    os.remove(path + ".tmp")
+                raise
+            self.total_bytes += os.path.getsize(path)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = sorted(self._files())
+        self.total_bytes = sum(size for _, _, size in files)
+        # Keep the newest file, even if it alone exceeds the budget
+        for _, path, size in files[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except OSError:
+                pass
+
+    def discard(self, key):
+        """Remove key from disk if present."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.total_bytes -= size
+            except OSError:
+                pass
+
+class AudioCache:
+    """
+    Two-tier cache of generated waveforms keyed by audio_cache_key: an
+    in-memory LRU in front of an optional on-disk store. Disk hits are
+    promoted to memory.
+
+    Entries are whole generation chunks, so repeated sentences are reused
+    across /tts requests and /tts-stream sessions.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=1024 * 1024 * 1024):
+        # The conditioning LRU works for any tensor payload
+        self.memory = ConditioningCache(max_entries, max_bytes) if max_entries > 0 else None
+        self.disk = DiskAudioStore(disk_dir, disk_max_bytes) if disk_dir else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.memory is not None or self.disk is not None
+
+    def get(self, key):
+        """Return the cached waveform for key, or None on a miss."""
+        wav = self.memory.get(key) if self.memory is not None else None
+        from_disk = False
+        if wav is None and self.disk is not None:
+            wav = self.disk.get(key)
+            if wav is not None:
+                from_disk = True
+                if self.memory is not None:
+                    self.memory.put(key, wav)
+        with self._lock:
+            if wav is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += from_disk
+        return wav
+
+    def put(self, key, wav):
+        """Store a generated waveform in every enabled tier."""
+        wav = wav.detach().cpu()
+        if self.memory is not None:
+            self.memory.put(key, wav)
+        if self.disk is not None:
+            # The disk tier is best-effort: torch.save reports a full disk
+            # as RuntimeError, not OSError
+            try:
+                self.disk.put(key, wav)
+            except Exception as e:
+                print(f"Failed to write cached audio to disk: {e}")
+
+    def stats(self):
+        """Hit/miss counters across both tiers."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+        if self.memory is not None:
+            memory = self.memory.stats()
+            stats.update(entries=memory["entries"], bytes=memory["bytes"], evictions=memory["evictions"])
+        if self.disk is not None:
+            stats["disk_bytes"] = self.disk.total_bytes
+        return stats
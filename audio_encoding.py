@@ -0,0 +1,432 @@
+import io
+import math
+import struct
+
+import torch
+import torchaudio.functional as AF
+
+try:
+    import soundfile
+    SOUNDFILE_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError: the package is installed but libsndfile is missing
+    soundfile = None
+    SOUNDFILE_AVAILABLE = False
+
+# WAV size fields used when the final length isn't known up front.
+# Most players and decoders treat this as "read until end of stream".
+STREAMING_DATA_SIZE = 0xFFFFFFFF
+
+SAMPLE_DTYPES = {
+    "int16": torch.int16,
+    "float32": torch.float32,
+}
+
+def pcm_buffer(wav, sample_format="int16", header=b""):
+    """
+    Convert a generated waveform tensor to raw mono PCM, written in one
+    vectorized step straight into a new buffer after header (a frame or WAV
+    header). Returns a memoryview over the buffer: the HTTP and WebSocket
+    transports send it as is, so the samples are never copied again.
+    """
+    samples = wav.detach().reshape(-1)
+    dtype = SAMPLE_DTYPES[sample_format]
+    itemsize = torch.empty(0, dtype=dtype).element_size()
+    buffer = bytearray(len(header) + samples.numel() * itemsize)
+    buffer[:len(header)] = header
+    if samples.numel():
+        out = torch.frombuffer(buffer, dtype=dtype, offset=len(header), count=samples.numel())
+        if sample_format == "int16":
+            samples = samples.clamp(-1.0, 1.0).mul_(32767.0)
+        # Converts the dtype (truncating like .to(torch.int16)) and moves
+        # the samples off the GPU in the same copy
+        out.copy_(samples)
+    return memoryview(buffer)
+
+def pcm_bytes(wav, sample_format="int16"):
+    """
+    Convert a generated waveform tensor to raw mono PCM bytes.
+    """
+    return bytes(pcm_buffer(wav, sample_format))
+
+def wav_buffer(wav, sample_rate):
+    """A complete 16-bit WAV file for wav, as a memoryview (see pcm_buffer)."""
+    return pcm_buffer(wav, header=wav_header(sample_rate, data_size=wav.numel() * 2))
+
+def wav_header(sample_rate, sample_format="int16", num_channels=1, data_size=None):
+    """
+    Build a 44-byte WAV header. If data_size is None the header uses
+    streaming placeholder sizes, so audio can be sent before it is generated.
+    """
+    if sample_format == "float32":
+        audio_format, bits_per_sample = 3, 32  # WAVE_FORMAT_IEEE_FLOAT
+    else:
+        audio_format, bits_per_sample = 1, 16  # WAVE_FORMAT_PCM
+
+    block_align = num_channels * bits_per_sample // 8
+    byte_rate = sample_rate * block_align
+
+    if data_size is None:
+        riff_size = data_size = STREAMING_DATA_SIZE
+    else:
+        riff_size = 36 + data_size
+
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, audio_format, num_channels, sample_rate, byte_rate, block_align, bits_per_sample,
+        b"data", data_size,
+    )
+
+# --- Streaming Encoders ---
+
+# G.711 mu-law, on 14-bit samples as in the ITU/Sun reference encoder
+MULAW_BIAS = 0x21
+MULAW_CLIP = 8159
+# Largest biased magnitude in each of the eight segments
+MULAW_SEGMENT_ENDS = torch.tensor([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF], dtype=torch.int32)
+
+def mulaw_bytes(wav):
+    """Encode a waveform as G.711 mu-law bytes (one byte per sample)."""
+    samples = (wav.detach().reshape(-1).cpu().clamp(-1.0, 1.0) * 32767.0).to(torch.int32) >> 2
+    negative = samples < 0
+    magnitude = torch.where(negative, -samples, samples).clamp(max=MULAW_CLIP) + MULAW_BIAS
+    # Segment from the lookup table, so boundaries are exact; magnitudes past
+    # the last segment get the largest code
+    exponent = torch.bucketize(magnitude, MULAW_SEGMENT_ENDS).to(torch.int32)
+    mantissa = (magnitude >> (exponent.clamp(max=7) + 1)) & 0x0F
+    code = torch.where(exponent > 7, 0x7F, (exponent << 4) | mantissa)
+    mask = torch.where(negative, 0x7F, 0xFF)
+    return (code ^ mask).to(torch.uint8).numpy().tobytes()
+
+class StreamingResampler:
+    """
+    Resample a waveform delivered in chunks as if it were one signal.
+
+    Each call resamples the new input together with some already consumed
+    history, and holds back `context` input samples of look-ahead, so the
+    filter sees the same neighbourhood as in one-shot resampling and chunk
+    seams don't click. finish() flushes the held-back samples.
+    """
+
+    def __init__(self, orig_freq, new_freq, context=64):
+        gcd = math.gcd(orig_freq, new_freq)
+        self.orig_freq = orig_freq
+        self.new_freq = new_freq
+        # Input positions that are multiples of in_step map to whole output samples
+        self.in_step = orig_freq // gcd
+        self.out_step = new_freq // gcd
+        self.context = -(-context // self.in_step) * self.in_step
+        self._buffer = torch.zeros(0)
+        self._start = 0  # start of the not yet emitted input in _buffer
+
+    def process(self, wav, final=False):
+        buffer = torch.cat([self._buffer, wav.detach().reshape(-1).cpu().to(torch.float32)])
+        if final:
+            # Pad to a whole step so every remaining sample is emitted
+            padding = (-(len(buffer) - self._start)) % self.in_step
+            buffer = torch.cat([buffer, torch.zeros(padding)])
+            end = len(buffer)
+        else:
+            end = len(buffer) - self.context
+            end -= (end - self._start) % self.in_step
+        if end <= self._start:
+            self._buffer = buffer
+            return torch.zeros(0)
+
+        resampled = AF.resample(buffer, self.orig_freq, self.new_freq)
+        out = resampled[self._start // self.in_step * self.out_step:end // self.in_step * self.out_step]
+
+        keep_from = max(0, end - self.context)
+        self._buffer = buffer[keep_from:]
+        self._start = end - keep_from
+        return out
+
+    def finish(self):
+        return self.process(torch.zeros(0), final=True)
+
+class StreamEncoder:
+    """
+    Encodes one utterance, delivered in chunks, into a single audio stream.
+
+    encode(wav) returns the bytes that are ready to send for the chunk (may
+    be empty while the codec buffers); finish() returns the rest. Joining
+    every returned piece gives one valid file. Audio is resampled to
+    output_rate (default: the format's rate, or the model's) on the way in.
+    """
+
+    media_type = "application/octet-stream"
+    default_rate = None
+
+    def __init__(self, sample_rate, output_rate=None):
+        self.sample_rate = sample_rate
+        self.output_rate = output_rate or self.default_rate or sample_rate
+        self._resampler = None
+        if self.output_rate != sample_rate:
+            self._resampler = StreamingResampler(sample_rate, self.output_rate)
+
+    @property
+    def content_type(self):
+        return self.media_type
+
+    def encode(self, wav):
+        if self._resampler is not None:
+            wav = self._resampler.process(wav)
+        return self._encode(wav)
+
+    def finish(self):
+        if self._resampler is None:
+            return self._finish()
+        return b"".join((self._encode(self._resampler.finish()), self._finish()))
+
+    def encode_all(self, wav):
+        """Encode a whole clip."""
+        data = self.encode(wav)
+        rest = self.finish()
+        return b"".join((data, rest)) if rest else data
+
+    def _encode(self, wav):
+        raise NotImplementedError
+
+    def _finish(self):
+        return b""
+
+class PCMEncoder(StreamEncoder):
+    """Raw little-endian 16-bit mono PCM."""
+
+    @property
+    def content_type(self):
+        return f"audio/L16; rate={self.output_rate}; channels=1"
+
+    def _encode(self, wav):
+        return pcm_buffer(wav)
+
+class WAVEncoder(StreamEncoder):
+    """16-bit PCM WAV; the header goes out with the first chunk, with streaming placeholder sizes."""
+
+    media_type = "audio/wav"
+
+    def __init__(self, sample_rate, output_rate=None):
+        super().__init__(sample_rate, output_rate)
+        self._header_sent = False
+
+    def _encode(self, wav):
+        header = b""
+        if not self._header_sent:
+            self._header_sent = True
+            header = wav_header(self.output_rate)
+        return pcm_buffer(wav, header=header)
+
+    def encode_all(self, wav):
+        # The size is known up front, so write an exact header
+        if self._resampler is not None:
+            wav = torch.cat([self._resampler.process(wav), self._resampler.finish()])
+        return wav_buffer(wav, self.output_rate)
+
+class MuLawEncoder(StreamEncoder):
+    """Raw 8 kHz G.711 mu-law, as used in telephony."""
+
+    default_rate = 8000
+
+    @property
+    def content_type(self):
+        return f"audio/PCMU; rate={self.output_rate}; channels=1"
+
+    def _encode(self, wav):
+        return mulaw_bytes(wav) if wav.numel() else b""
+
+class _DrainableSink:
+    """
+    Write-only file object for soundfile that hands out bytes as they are
+    written. Codecs that seek back to patch a header on close can only
+    change bytes that haven't been drained yet; the rest of the rewrite is
+    dropped, so encoders whose header must be patched (FLAC, MP3) deal
+    with that themselves.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+        self._base = 0  # absolute offset of _data[0]
+        self._pos = 0
+        self._size = 0
+
+    def write(self, data):
+        data = bytes(data)
+        size = len(data)
+        start = self._pos - self._base
+        if start < 0:
+            # Rewriting bytes that were already sent: drop that part
+            data = data[-start:]
+            start = 0
+        if data:
+            if start > len(self._data):
+                self._data.extend(bytes(start - len(self._data)))
+            self._data[start:start + len(data)] = data
+        self._pos += size
+        self._size = max(self._size, self._pos)
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        return b""
+
+    def drain(self):
+        data = bytes(self._data)
+        self._base += len(self._data)
+        self._data = bytearray()
+        return data
+
+class SoundFileEncoder(StreamEncoder):
+    """Compressed formats through libsndfile (the soundfile package)."""
+
+    container = None
+    subtype = None
+    # Passed to libsndfile when set
+    compression_level = None
+    bitrate_mode = None
+
+    def __init__(self, sample_rate, output_rate=None):
+        if not SOUNDFILE_AVAILABLE:
+            raise ValueError(f"Format {self.container}/{self.subtype} requires the soundfile package")
+        if self.subtype not in soundfile.available_subtypes(self.container):
+            raise ValueError(f"This libsndfile build can't write {self.container}/{self.subtype}")
+        super().__init__(sample_rate, output_rate)
+        self._sink = _DrainableSink()
+        self._file = soundfile.SoundFile(
+            self._sink, mode="w", samplerate=self.output_rate, channels=1,
+            format=self.container, subtype=self.subtype,
+            compression_level=self.compression_level, bitrate_mode=self.bitrate_mode,
+        )
+
+    def _write(self, wav):
+        if wav.numel():
+            self._file.write(wav.detach().reshape(-1).cpu().to(torch.float32).clamp(-1.0, 1.0).numpy())
+
+    def _encode(self, wav):
+        self._write(wav)
+        return self._sink.drain()
+
+    def _finish(self):
+        self._file.close()
+        return self._sink.drain()
+
+    def encode_all(self, wav):
+        # Nothing is drained before close, so the codec can fill in the
+        # length fields of its header
+        if self._resampler is not None:
+            wav = torch.cat([self._resampler.process(wav), self._resampler.finish()])
+        self._write(wav)
+        return self._finish()
+
+class FLACEncoder(SoundFileEncoder):
+    """
+    FLAC, sent whole by finish(). libsndfile writes the total sample count
+    into the header only on close, and decoders such as libsndfile's can't
+    read a stream whose header leaves it unknown.
+    """
+
+    media_type = "audio/flac"
+    container, subtype = "FLAC", "PCM_16"
+
+    def _encode(self, wav):
+        self._write(wav)
+        return b""
+
+class OpusEncoder(SoundFileEncoder):
+    media_type = "audio/ogg; codecs=opus"
+    container, subtype = "OGG", "OPUS"
+
+    # Opus only runs at these rates
+    RATES = (8000, 12000, 16000, 24000, 48000)
+
+    def __init__(self, sample_rate, output_rate=None):
+        if (output_rate or sample_rate) not in self.RATES:
+            output_rate = 48000
+        super().__init__(sample_rate, output_rate)
+
+# MPEG audio layer III bitrates (kbps) and sample rates by MPEG version
+MP3_BITRATES = {
+    "1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def mp3_frame_size(header):
+    """Length in bytes of the layer III frame starting with the 4-byte header."""
+    value = int.from_bytes(header[:4], "big")
+    version = (value >> 19) & 0x3
+    bitrate = MP3_BITRATES["1" if version == 3 else "2"][(value >> 12) & 0xF] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][(value >> 10) & 0x3]
+    padding = (value >> 9) & 0x1
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+class MP3Encoder(SoundFileEncoder):
+    """
+    MPEG layer III at a constant bitrate.
+
+    libsndfile reserves the first frame for a Xing/LAME tag that it fills in
+    on close. A streamed file has sent that frame by then, so it is dropped
+    instead: without the tag decoders work out the length from the bitrate,
+    which is only right for constant-bitrate streams, and the decoded audio
+    keeps the encoder delay and the padding of the last frame.
+    """
+
+    media_type = "audio/mpeg"
+    container, subtype = "MP3", "MPEG_LAYER_III"
+    # 80 kbps at 24 kHz
+    compression_level, bitrate_mode = 0.5, "CONSTANT"
+
+    def __init__(self, sample_rate, output_rate=None):
+        super().__init__(sample_rate, output_rate)
+        self._streamed = False
+        self._tag = b""  # start of the stream, held until the tag frame is complete
+
+    def _drop_tag(self, data):
+        if self._tag is None:
+            return data
+        self._tag += data
+        if len(self._tag) < 4 or len(self._tag) < mp3_frame_size(self._tag):
+            return b""
+        data, self._tag = self._tag[mp3_frame_size(self._tag):], None
+        return data
+
+    def _encode(self, wav):
+        self._write(wav)
+        data = self._sink.drain()
+        self._streamed = self._streamed or bool(data)
+        return self._drop_tag(data)
+
+    def _finish(self):
+        # Nothing sent yet: the file is complete, tag included
+        if not self._streamed:
+            return super()._finish()
+        return self._drop_tag(super()._finish())
+
+ENCODERS = {
+    "pcm": PCMEncoder,
+    "wav": WAVEncoder,
+    "flac": FLACEncoder,
+    "opus": OpusEncoder,
+    "mp3": MP3Encoder,
+    "mulaw": MuLawEncoder,
+}
+
+def create_encoder(output_format, sample_rate, output_rate=None):
+    """
+    Streaming encoder for output_format at output_rate Hz (default: the
+    format's own rate, or sample_rate). Raises ValueError if the format is
+    unknown or unavailable.
+    """
+    if output_format not in ENCODERS:
+        raise ValueError(f"Unsupported format: {output_format}")
+    return ENCODERS[output_format](sample_rate, output_rate)
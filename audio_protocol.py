@@ -0,0 +1,81 @@
+"""
+Binary WebSocket frame format for streamed audio chunks.
+
+Shared by the server (app.py) and streaming_client.py, so it only depends on
+the standard library.
+
+Each binary frame is a fixed 12-byte little-endian header followed by raw PCM:
+
+    version       uint8   protocol version (currently 1)
+    flags         uint8   FLAG_FINAL | FLAG_FLOAT32 | FLAG_ENCODED
+    stream_id     uint16  utterance on a multiplexed connection (0 if untagged)
+    chunk_index   uint32  index of the chunk within the utterance
+    sample_count  uint32  number of mono samples in the payload
+
+With FLAG_ENCODED the payload is instead the next slice of one encoded audio
+stream (the request's "format", e.g. Ogg/Opus): joining the payloads of all
+frames of an utterance gives the file. sample_count is then the number of
+samples the chunk added, which the codec may not have emitted yet.
+"""
+
+import struct
+
+PROTOCOL_VERSION = 1
+
+HEADER = struct.Struct("<BBHII")
+
+FLAG_FINAL = 0x01
+FLAG_FLOAT32 = 0x02
+FLAG_ENCODED = 0x04
+
+SAMPLE_FORMATS = {
+    "int16": 2,
+    "float32": 4,
+}
+
+def pack_header(chunk_index, sample_count, is_final=False, sample_format="int16", stream_id=0):
+    """Build the header for one binary audio frame."""
+    flags = 0
+    if is_final:
+        flags |= FLAG_FINAL
+    if sample_format == "float32":
+        flags |= FLAG_FLOAT32
+    elif sample_format == "encoded":
+        flags |= FLAG_ENCODED
+    return HEADER.pack(PROTOCOL_VERSION, flags, stream_id, chunk_index, sample_count)
+
+def pack_frame(chunk_index, pcm, is_final=False, sample_format="int16", stream_id=0):
+    """Build a complete binary audio frame from raw PCM bytes."""
+    sample_count = len(pcm) // SAMPLE_FORMATS[sample_format]
+    return pack_header(chunk_index, sample_count, is_final, sample_format, stream_id) + pcm
+
+def pack_encoded_frame(chunk_index, data, sample_count, is_final=False, stream_id=0):
+    """Build a binary frame carrying a slice of an encoded audio stream."""
+    return pack_header(chunk_index, sample_count, is_final, "encoded", stream_id) + data
+
+def unpack_frame(frame):
+    """
+    Parse a binary audio frame.
+    Returns (chunk_index, sample_count, is_final, sample_format, pcm) where pcm
+    is a memoryview over the payload. sample_format is "encoded" for frames
+    with FLAG_ENCODED.
+    """
+    if len(frame) < HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(frame)} bytes")
+    version, flags, _, chunk_index, sample_count = HEADER.unpack_from(frame)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary frame version: {version}")
+    pcm = memoryview(frame)[HEADER.size:]
+    if flags & FLAG_ENCODED:
+        return chunk_index, sample_count, bool(flags & FLAG_FINAL), "encoded", pcm
+    sample_format = "float32" if flags & FLAG_FLOAT32 else "int16"
+    expected = sample_count * SAMPLE_FORMATS[sample_format]
+    if len(pcm) != expected:
+        raise ValueError(f"Binary frame payload is {len(pcm)} bytes, expected {expected}")
+    return chunk_index, sample_count, bool(flags & FLAG_FINAL), sample_format, pcm
+
+def frame_stream_id(frame):
+    """The stream_id of a binary audio frame, identifying its utterance."""
+    if len(frame) < HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(frame)} bytes")
+    return HEADER.unpack_from(frame)[2]
@@ -0,0 +1,369 @@
+"""
+TTS backends: the interface between the server and a speech model.
+
+The server only talks to a backend: generate a batch of texts, stream one
+text as it is generated, prepare speaker conditionals from reference audio
+(decoded in memory, see reference_audio.py) and load saved ones, plus the
+output sample rate. TTS_BACKEND selects the
+implementation:
+
+- "chatterbox": ChatterboxMultilingualTTS (the default)
+- "fake": synthetic audio with a configurable latency per character, for
+  profiling and load testing the serving layer without model weights
+- "module:Class": any other TTSBackend subclass, constructed with the device
+
+replicas.ReplicaPool implements the same interface by dispatching to
+backends running in separate processes.
+"""
+
+import copy
+import hashlib
+import importlib
+import math
+import time
+
+import torch
+
+import config
+from cancellation import cancel_scope, install_step_check
+from reference_audio import decode_audio
+
+class TTSBackend:
+    """
+    Base class of TTS backends. Subclasses implement generate_batch and
+    conditionals_from_wav; the other methods have working defaults.
+
+    cancel arguments are CancelTokens (or None): generation stops with
+    Cancelled once the token fires. session arguments are what open_session
+    returned for the conditionals given with them (or None). All methods
+    block and are called from inference worker threads, except open_session.
+    """
+
+    # Output sample rate in Hz
+    sr = None
+    device = "cpu"
+
+    def generate_batch(self, texts, language, conds=None, cancels=None, session=None):
+        """
+        Generate one waveform per text with shared speaker conditionals.
+        A failed text returns its exception in place of the waveform.
+        """
+        raise NotImplementedError
+
+    def generate(self, text, language, conds=None, cancel=None, session=None):
+        """Generate the waveform for a single text."""
+        result = self.generate_batch([text], language, conds, [cancel], session=session)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def generate_stream(self, text, language, conds=None, cancel=None, session=None, **windows):
+        """
+        Yield waveform pieces for text as they are generated. windows holds
+        the incremental streaming settings (first_window_tokens,
+        window_tokens, context_tokens, crossfade_ms). By default the whole
+        text is generated and yielded as one piece.
+        """
+        yield self.generate(text, language, conds, cancel, session=session)
+
+    def open_session(self, conds=None):
+        """
+        Start a session for generating several texts (an utterance's chunks)
+        with conds, or the default voice: state the generate methods share
+        when given it, such as work on the conditionals done once instead of
+        per text. Returns an object with a close() method, called when the
+        utterance ends, or None if the backend keeps no such state.
+        """
+        return None
+
+    def prepare_conditionals(self, audio_bytes):
+        """
+        Compute speaker conditionals from reference audio bytes, decoded in
+        memory. Raises ReferenceAudioError for unusable audio.
+        """
+        wav, sample_rate = decode_audio(audio_bytes, config.REFERENCE_MAX_S)
+        return self.conditionals_from_wav(wav, sample_rate)
+
+    def conditionals_from_wav(self, wav, sample_rate):
+        """Compute speaker conditionals from a mono reference waveform tensor."""
+        raise NotImplementedError
+
+    @classmethod
+    def read_conditionals(cls, path):
+        """Load conditionals saved with conds.save(path), on the CPU."""
+        raise NotImplementedError
+
+    def load_conditionals(self, path):
+        """Load saved conditionals onto this backend's device."""
+        return self.read_conditionals(path).to(self.device)
+
+    def warm_up(self, language, text):
+        """Generate text once so lazy initialization happens before real requests."""
+        return self.generate_batch([text], language)
+
+    def generation_params(self):
+        """
+        Settings that change the audio generated for a text and voice, as a
+        JSON-serializable dict. They are part of the audio cache key, so audio
+        cached on disk isn't served once they change.
+        """
+        return {"backend": f"{type(self).__module__}.{type(self).__qualname__}"}
+
+    def shutdown(self):
+        """Release the backend's resources."""
+
+# --- Chatterbox ---
+
+# Sampling settings of every generation (the model's defaults)
+SAMPLING = dict(temperature=0.8, cfg_weight=0.5, repetition_penalty=2.0, min_p=0.05, top_p=1.0)
+
+def generate_texts(model, language, texts, conds=None, cancels=None, decoder=None, session=None):
+    """
+    Generate one waveform per text with shared conditionals. Uses the model's
+    generate_batch if it has one and no text can be cancelled; otherwise
+    generates each text in turn, with a failed text returning its exception
+    in place of the waveform. With a
+    compiled_decoding.CompiledDecoder or a token_streaming.GenerationSession
+    (whose conditionals replace conds), texts go through token_streaming's
+    decoding loop instead.
+
+    cancels optionally holds one cancellation token (or None) per text; a
+    cancelled text stops at its next decoding step and returns Cancelled.
+    """
+    cancels = cancels or [None] * len(texts)
+    # Shallow copy so concurrent callers don't overwrite each other's
+    # speaker conditionals on a shared model instance
+    model = copy.copy(model)
+    if session is not None:
+        model.conds = session.conds
+    elif conds is not None:
+        model.conds = conds.to(model.device)
+
+    if decoder is not None or session is not None:
+        from token_streaming import generate_waveform
+
+        generate = lambda text: generate_waveform(model, text, language, decoder=decoder, session=session, **SAMPLING)
+    elif hasattr(model, "generate_batch") and all(cancel is None for cancel in cancels):
+        # A batched call can't stop one text early, so it only serves
+        # batches without cancellation tokens
+        return model.generate_batch(texts, language_id=language, **SAMPLING)
+    else:
+        generate = lambda text: model.generate(text, language_id=language, **SAMPLING)
+
+    results = []
+    for text, cancel in zip(texts, cancels):
+        try:
+            with cancel_scope(cancel):
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                results.append(generate(text))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def compute_conditionals(model, wav, sample_rate, exaggeration=0.5):
+    """
+    Compute speaker conditionals from a mono reference waveform. The same
+    steps as model.prepare_conditionals, which only takes a file path.
+    """
+    import librosa
+    from chatterbox.mtl_tts import S3_SR, S3GEN_SR, Conditionals, T3Cond
+
+    ref_wav = wav.detach().cpu().to(torch.float32).numpy()
+    if sample_rate != S3GEN_SR:
+        ref_wav = librosa.resample(ref_wav, orig_sr=sample_rate, target_sr=S3GEN_SR)
+    ref_16k_wav = librosa.resample(ref_wav, orig_sr=S3GEN_SR, target_sr=S3_SR)
+
+    s3gen_ref_dict = model.s3gen.embed_ref(ref_wav[:model.DEC_COND_LEN], S3GEN_SR, device=model.device)
+
+    # Speech prompt tokens
+    cond_prompt_tokens = None
+    prompt_len = model.t3.hp.speech_cond_prompt_len
+    if prompt_len:
+        cond_prompt_tokens, _ = model.s3gen.tokenizer.forward([ref_16k_wav[:model.ENC_COND_LEN]], max_len=prompt_len)
+        cond_prompt_tokens = torch.atleast_2d(cond_prompt_tokens).to(model.device)
+
+    # Voice encoder speaker embedding
+    speaker_emb = torch.from_numpy(model.ve.embeds_from_wavs([ref_16k_wav], sample_rate=S3_SR))
+    speaker_emb = speaker_emb.mean(axis=0, keepdim=True).to(model.device)
+
+    t3_cond = T3Cond(
+        speaker_emb=speaker_emb,
+        cond_prompt_speech_tokens=cond_prompt_tokens,
+        emotion_adv=exaggeration * torch.ones(1, 1, 1),
+    ).to(device=model.device)
+    return Conditionals(t3_cond, s3gen_ref_dict)
+
+class ChatterboxBackend(TTSBackend):
+    """
+    ChatterboxMultilingualTTS, loaded as configured in model_loading, in
+    TTS_PRECISION unless precision is given, with compiled decoding if
+    TTS_COMPILE is set (or compiled is given).
+    """
+
+    def __init__(self, device="cpu", model=None, precision=None, compiled=None):
+        from model_loading import load_model, resolve_precision
+
+        self.precision = resolve_precision(config.PRECISION if precision is None else precision, device)
+        if model is None:
+            model = load_model(device, precision=self.precision)
+        self.model = model
+        self.device = device
+        self.sr = model.sr
+        # Lets cancelled requests stop at the next decoding step
+        install_step_check(model)
+
+        self.decoder = None
+        if config.COMPILE if compiled is None else compiled:
+            from compiled_decoding import CompiledDecoder
+
+            self.decoder = CompiledDecoder(model.t3, config.COMPILE_BUCKETS)
+
+    def _autocast(self):
+        from model_loading import autocast
+
+        return autocast(self.device, self.precision)
+
+    def generate_batch(self, texts, language, conds=None, cancels=None, session=None):
+        with self._autocast():
+            return generate_texts(self.model, language, texts, conds, cancels, decoder=self.decoder, session=session)
+
+    def generate_stream(self, text, language, conds=None, cancel=None, session=None, **windows):
+        from token_streaming import generate_stream
+
+        if session is not None:
+            conds = session.conds
+        elif conds is not None:
+            conds = conds.to(self.device)
+        # The generator runs on one inference thread, so the thread-local
+        # autocast state holds across its steps
+        with cancel_scope(cancel), self._autocast():
+            yield from generate_stream(
+                copy.copy(self.model), text, language, conds=conds, decoder=self.decoder, session=session,
+                **windows, **SAMPLING,
+            )
+
+    def open_session(self, conds=None):
+        from token_streaming import GenerationSession
+
+        return GenerationSession(conds.to(self.device) if conds is not None else self.model.conds)
+
+    def conditionals_from_wav(self, wav, sample_rate):
+        return compute_conditionals(self.model, wav, sample_rate)
+
+    def generation_params(self):
+        return dict(
+            super().generation_params(), precision=self.precision, compiled=self.decoder is not None, sampling=SAMPLING
+        )
+
+    def warm_up(self, language, text):
+        results = super().warm_up(language, text)
+        if self.decoder is not None:
+            # After a real generation, so the step compiles with the attention
+            # setup generation leaves on the transformer
+            with self._autocast():
+                self.decoder.warm_up(output_attentions=self.model.t3.hp.is_multilingual)
+        return results
+
+    @classmethod
+    def read_conditionals(cls, path):
+        from chatterbox.mtl_tts import Conditionals
+
+        return Conditionals.load(path, map_location="cpu")
+
+# --- Fake ---
+
+class FakeConditionals:
+    """Speaker conditionals of the fake backend: a pitch derived from the reference audio."""
+
+    def __init__(self, pitch=220.0):
+        self.pitch = torch.tensor(float(pitch))
+
+    def to(self, device):
+        return self
+
+    def save(self, path):
+        torch.save({"pitch": self.pitch}, path)
+
+class FakeBackend(TTSBackend):
+    """
+    Deterministic synthetic TTS. Generation sleeps ms_per_char per character
+    and returns a tone of audio_ms_per_char per character, pitched by the
+    voice. Each character counts as one decoding step (and one speech token
+    for streaming windows), so cancellation and incremental streaming behave
+    like the real model at a controllable speed.
+    """
+
+    sr = 24000
+
+    def __init__(self, device="cpu", ms_per_char=None, audio_ms_per_char=None):
+        self.device = device
+        self.ms_per_char = config.FAKE_MS_PER_CHAR if ms_per_char is None else ms_per_char
+        self.audio_ms_per_char = config.FAKE_AUDIO_MS_PER_CHAR if audio_ms_per_char is None else audio_ms_per_char
+        print(f"Using the fake TTS backend ({self.ms_per_char} ms per character)")
+
+    def _steps(self, count, cancel):
+        delay = self.ms_per_char / 1000.0
+        for _ in range(count):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            if delay:
+                time.sleep(delay)
+
+    def _tone(self, start_char, end_char, conds):
+        samples_per_char = self.audio_ms_per_char / 1000.0 * self.sr
+        start, end = int(start_char * samples_per_char), int(end_char * samples_per_char)
+        # Continuous phase across streamed pieces
+        t = torch.arange(start, end, dtype=torch.float32) / self.sr
+        pitch = float(conds.pitch) if conds is not None else 220.0
+        return (0.3 * torch.sin(2 * math.pi * pitch * t)).unsqueeze(0)
+
+    def generate_batch(self, texts, language, conds=None, cancels=None, session=None):
+        cancels = cancels or [None] * len(texts)
+        results = []
+        for text, cancel in zip(texts, cancels):
+            try:
+                self._steps(len(text), cancel)
+                results.append(self._tone(0, len(text), conds))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def generate_stream(self, text, language, conds=None, cancel=None, session=None, **windows):
+        first_window = max(1, windows.get("first_window_tokens") or len(text))
+        window = max(1, windows.get("window_tokens") or len(text))
+        done = 0
+        while done < len(text):
+            size = min(first_window if done == 0 else window, len(text) - done)
+            self._steps(size, cancel)
+            yield self._tone(done, done + size, conds)
+            done += size
+
+    def generation_params(self):
+        return dict(super().generation_params(), audio_ms_per_char=self.audio_ms_per_char)
+
+    def conditionals_from_wav(self, wav, sample_rate):
+        return FakeConditionals(110.0 + hashlib.sha256(wav.numpy().tobytes()).digest()[0])
+
+    @classmethod
+    def read_conditionals(cls, path):
+        return FakeConditionals(float(torch.load(path)["pitch"]))
+
+BACKENDS = {
+    "chatterbox": ChatterboxBackend,
+    "fake": FakeBackend,
+}
+
+def backend_class(name=None):
+    """Resolve a TTS_BACKEND name ("chatterbox", "fake" or "module:Class") to its class."""
+    name = name or config.BACKEND
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown TTS backend: {name}")
+    return getattr(importlib.import_module(module_name), class_name)
+
+def load_backend(device, name=None):
+    """Construct the configured backend on device."""
+    return backend_class(name)(device)
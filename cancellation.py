@@ -0,0 +1,94 @@
+"""
+Cooperative cancellation of in-flight generation.
+
+A CancelToken is created per request and cancelled when the client goes
+away, asks to stop, or the request runs past its deadline. Generation code
+runs inside cancel_scope(token); a forward pre-hook on the T3 transformer
+calls check_cancelled() before every decoding step, so a cancelled request
+stops at the next speech token instead of finishing the utterance.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+class Cancelled(Exception):
+    """Generation was cancelled (client disconnect, cancel message or deadline)."""
+
+class CancelToken:
+    """
+    Thread-safe cancellation flag for one request. deadline is an optional
+    time.monotonic() value after which the token counts as cancelled.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, deadline=None):
+        self.id = next(self._ids)
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the token and run its callbacks once."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Call callback() when the token is cancelled (now, if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise Cancelled("request deadline exceeded")
+
+_scope = threading.local()
+
+@contextmanager
+def cancel_scope(token):
+    """
+    Make token the current thread's cancellation token. token is anything
+    with raise_if_cancelled(), or None for no cancellation.
+    """
+    previous = getattr(_scope, "token", None)
+    _scope.token = token
+    try:
+        yield
+    finally:
+        _scope.token = previous
+
+def check_cancelled():
+    """Raise Cancelled if the current thread's token has been cancelled."""
+    token = getattr(_scope, "token", None)
+    if token is not None:
+        token.raise_if_cancelled()
+
+def install_step_check(model):
+    """
+    Check for cancellation before every forward pass of the model's T3
+    transformer, i.e. once per generated speech token.
+    """
+    tfmr = model.t3.tfmr
+    if not getattr(tfmr, "_cancellation_hook", None):
+        tfmr._cancellation_hook = tfmr.register_forward_pre_hook(lambda module, args: check_cancelled())
@@ -4,7 +4,7 @@ import asyncio
 import subprocess
 import sys
 
-def make_api_request(api_url, text, language, reference_audio=None, output_file="output.wav"):
+def make_api_request(api_url, text, language, reference_audio=None, output_file="output.wav", voice_id=None, http_stream=False):
     """
     Sends a request to the TTS server for either standard TTS or voice cloning.
     """
@@ -14,6 +14,14 @@ def make_api_request(api_url, text, language, reference_audio=None, output_file=
     data = {"text": text, "language": language}
     files = {}
 
+    # A registered voice is referenced by ID instead of re-uploading the audio
+    if voice_id:
+        data["voice_id"] = voice_id
+
+    # Ask the server to send each chunk's audio as soon as it's generated
+    if http_stream:
+        data["stream"] = "true"
+
     # If a reference audio file is provided, add it to the request
     if reference_audio:
         try:
@@ -24,12 +32,13 @@ def make_api_request(api_url, text, language, reference_audio=None, output_file=
 
     try:
         # Send the POST request to the server
-        response = requests.post(api_url, data=data, files=files)
+        response = requests.post(api_url, data=data, files=files, stream=http_stream)
         response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
 
-        # Save the returned audio content to a file
+        # Save the returned audio content to a file, writing streamed chunks as they arrive
         with open(output_file, "wb") as f:
-            f.write(response.content)
+            for block in response.iter_content(chunk_size=None):
+                f.write(block)
         print(f"Successfully saved audio to '{output_file}'")
 
     except requests.exceptions.RequestException as e:
@@ -50,8 +59,10 @@ def main():
     parser.add_argument("--text", required=True, help="The text to synthesize")
     parser.add_argument("--lang", default="en", help="The language code (e.g., 'en', 'fr', 'es')")
     parser.add_argument("--ref_audio", help="Path to the reference .wav file for voice cloning (optional)")
+    parser.add_argument("--voice_id", help="ID of a voice registered via POST /voices (optional)")
     parser.add_argument("--output", default="output.wav", help="The filename for the output audio")
     parser.add_argument("--stream", action="store_true", help="Use streaming mode for faster response")
+    parser.add_argument("--http-stream", action="store_true", help="Stream over plain HTTP (chunked transfer) instead of WebSocket")
 
     args = parser.parse_args()
 
@@ -69,6 +80,8 @@ def main():
             
             if args.ref_audio:
                 cmd.extend(["--ref_audio", args.ref_audio])
+            if args.voice_id:
+                cmd.extend(["--voice_id", args.voice_id])
             
             subprocess.run(cmd, check=True)
         except subprocess.CalledProcessError as e:
@@ -77,7 +90,7 @@ def main():
             print("streaming_client.py not found. Make sure it's in the same directory.")
     else:
         # Use the regular API request
-        make_api_request(args.server_url, args.text, args.lang, args.ref_audio, args.output)
+        make_api_request(args.server_url, args.text, args.lang, args.ref_audio, args.output, args.voice_id, args.http_stream)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
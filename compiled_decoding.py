@@ -0,0 +1,178 @@
+"""
+Compiled speech-token decoding (TTS_COMPILE).
+
+Every speech token is one pass of the T3 transformer over a single position,
+and for short texts on CPU much of that step is Python overhead across the
+transformer's layers. CompiledDecoder runs the step through torch.compile.
+
+A compiled graph is specialized to its input shapes, and the KV cache grows
+by one position per token, so the cache is a StaticCache of one of a few
+bucket lengths (TTS_COMPILE_BUCKETS) instead: attention runs over the whole
+bucket with the unused positions masked, and the step compiles once per
+bucket. The prompt pass, whose length varies with the text, runs eagerly;
+its cache then moves to the smallest bucket that holds it, and on to the
+next bucket whenever that one fills up. Prompts or generations longer than
+the largest bucket continue in eager mode.
+
+warm_up compiles every bucket ahead of the first request, and a step that
+fails to compile turns compilation off for the rest of the process.
+Without a CompiledDecoder, DecodeSession is the eager decoding loop.
+"""
+
+import time
+
+import torch
+
+from cancellation import check_cancelled
+
+def decoder_forward(t3, inputs_embeds, cache, cache_position, output_attentions=False):
+    """One pass of the transformer and speech head; returns (logits, attentions)."""
+    # forward, not __call__: cancellation is checked by the session, and
+    # the transformer's pre-hook would split the compiled graph
+    output = t3.tfmr.forward(
+        inputs_embeds=inputs_embeds,
+        past_key_values=cache,
+        cache_position=cache_position,
+        use_cache=True,
+        output_attentions=output_attentions,
+    )
+    return t3.speech_head(output.last_hidden_state), output.attentions
+
+class CompiledDecoder:
+    """torch.compile'd decoder steps for a T3 model, with bucketed static KV caches."""
+
+    def __init__(self, t3, buckets):
+        self.t3 = t3
+        self.buckets = sorted(set(buckets))
+        self.enabled = bool(self.buckets)
+        self.warmed = set()
+        self._compiled = torch.compile(self.forward, dynamic=False)
+
+    def forward(self, inputs_embeds, cache, cache_position, output_attentions=False):
+        return decoder_forward(self.t3, inputs_embeds, cache, cache_position, output_attentions)
+
+    def step(self, inputs_embeds, cache, cache_position, output_attentions=False):
+        """A single-position step: compiled for static caches, eager otherwise."""
+        from transformers import StaticCache
+
+        if self.enabled and isinstance(cache, StaticCache):
+            try:
+                return self._compiled(inputs_embeds, cache, cache_position, output_attentions)
+            except Exception as e:
+                self.enabled = False
+                print(f"Compiled decoding failed, using eager mode: {type(e).__name__}: {e}")
+        return decoder_forward(self.t3, inputs_embeds, cache, cache_position, output_attentions)
+
+    def bucket_for(self, length):
+        """Smallest bucket holding length positions, or None (also when compilation is off)."""
+        if not self.enabled:
+            return None
+        for bucket in self.buckets:
+            if bucket >= length:
+                return bucket
+        return None
+
+    def session(self, output_attentions=False, prefix=None):
+        """Decoding state for one generation."""
+        return DecodeSession(self.t3, self, output_attentions, prefix)
+
+    @torch.inference_mode()
+    def warm_up(self, output_attentions=False):
+        """Compile the step for every bucket not compiled yet, with a dummy cache."""
+        hidden_size = self.t3.tfmr.config.hidden_size
+        device = self.t3.device
+        for bucket in self.buckets:
+            if not self.enabled:
+                return
+            if bucket in self.warmed:
+                continue
+            start = time.perf_counter()
+            session = self.session(output_attentions)
+            # Batch of 2 like generation with classifier-free guidance; the
+            # one-position prompt lands in the smallest bucket, so grow into this one
+            session(torch.zeros(2, 1, hidden_size, device=device))
+            session.resize(bucket)
+            session(torch.zeros(2, 1, hidden_size, device=device))
+            self.warmed.add(bucket)
+            print(f"Compiled decoder step for {bucket} positions in {time.perf_counter() - start:.1f}s")
+
+class DecodeSession:
+    """
+    The KV cache of one generation. Called with each step's input embeddings
+    (the prompt first, then one position at a time); returns (logits,
+    attentions) like T3HuggingfaceBackend. Steps run through decoder, a
+    CompiledDecoder, or eagerly without one.
+
+    prefix optionally holds per-layer (keys, values) of positions already
+    computed, e.g. a voice's conditioning; the prompt then starts after them.
+    """
+
+    def __init__(self, t3, decoder=None, output_attentions=False, prefix=None):
+        from transformers import DynamicCache
+
+        self.t3 = t3
+        self.decoder = decoder
+        self.output_attentions = output_attentions
+        self.cache = DynamicCache(config=t3.tfmr.config)
+        self.length = 0
+        self.prompted = False
+        if prefix:
+            # DynamicCache concatenates rather than writing in place, so the
+            # prefix tensors can be shared between sessions
+            for index, (keys, values) in enumerate(prefix):
+                self.cache.update(keys, values, index)
+            self.length = prefix[0][0].size(-2)
+
+    def __call__(self, inputs_embeds):
+        from transformers import StaticCache
+
+        check_cancelled()
+        count = inputs_embeds.size(1)
+        cache_position = torch.arange(self.length, self.length + count, device=inputs_embeds.device)
+        if not self.prompted:
+            # The prompt pass runs eagerly, then its cache moves to a bucket
+            self.prompted = True
+            result = decoder_forward(self.t3, inputs_embeds, self.cache, cache_position, self.output_attentions)
+            self.length += count
+            self.resize(self.length + 1)
+            return result
+
+        if isinstance(self.cache, StaticCache):
+            self.resize(self.length + count)
+            result = self.decoder.step(inputs_embeds, self.cache, cache_position, self.output_attentions)
+        else:
+            result = decoder_forward(self.t3, inputs_embeds, self.cache, cache_position, self.output_attentions)
+        self.length += count
+        return result
+
+    def resize(self, length):
+        """
+        Move the cache to the bucket for length positions unless it already
+        holds them; past the largest bucket, to a DynamicCache for eager mode.
+        """
+        from transformers import DynamicCache, StaticCache
+
+        if self.decoder is None:
+            return
+        if isinstance(self.cache, StaticCache) and length <= self.cache.get_max_cache_shape():
+            return
+        bucket = self.decoder.bucket_for(length)
+        if bucket is None and isinstance(self.cache, DynamicCache):
+            return
+        cache = DynamicCache(config=self.t3.tfmr.config) if bucket is None else (
+            StaticCache(config=self.t3.tfmr.config, max_cache_len=bucket)
+        )
+        for index, layer in enumerate(self.cache.layers):
+            keys, values = layer.keys[:, :, :self.length], layer.values[:, :, :self.length]
+            if bucket is None:
+                cache.update(keys, values, index)
+                continue
+            target = cache.layers[index]
+            target.lazy_initialization(keys, values)
+            if values.dtype != keys.dtype:
+                # Under autocast the keys leave the rotary embedding in fp32
+                target.values = target.values.to(values.dtype)
+                torch._dynamo.mark_static_address(target.values)
+            target.keys[:, :, :self.length].copy_(keys)
+            target.values[:, :, :self.length].copy_(values)
+        self.cache = cache
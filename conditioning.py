@@ -0,0 +1,95 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import torch
+
+def hash_audio(audio_bytes):
+    """Content hash used as the cache key for a reference audio clip."""
+    return hashlib.sha256(audio_bytes).hexdigest()
+
+def conditionals_nbytes(obj):
+    """Approximate memory held by the tensors inside prepared conditionals."""
+    if isinstance(obj, torch.Tensor):
+        return obj.element_size() * obj.nelement()
+    if isinstance(obj, dict):
+        return sum(conditionals_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(conditionals_nbytes(v) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return sum(conditionals_nbytes(v) for v in vars(obj).values())
+    return 0
+
+class ConditioningCache:
+    """
+    Thread-safe LRU cache of prepared speaker conditionals, keyed by the
+    content hash of the reference audio.
+
+    Entries are evicted least-recently-used first once either max_entries or
+    max_bytes (estimated tensor memory) is exceeded.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached conditionals for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, conds):
+        """Store conditionals under key, evicting old entries if needed."""
+        nbytes = conditionals_nbytes(conds)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (conds, nbytes)
+            self.total_bytes += nbytes
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+            ):
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def discard(self, key):
+        """Drop key from the cache if present."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,210 @@
+import os
+
+# --- Environment Helpers ---
+
+def env_str(name, default=None):
+    """Read a string setting from the environment."""
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+def env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def env_float(name, default):
+    """Read a float setting from the environment."""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def env_bool(name, default=False):
+    """Read a boolean setting from the environment (1/true/yes/on)."""
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def env_list(name, default=()):
+    """Read a comma-separated list setting from the environment."""
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def env_dict(name, default=()):
+    """Read a comma-separated list of key:value pairs from the environment."""
+    pairs = (item.rpartition(":") for item in env_list(name, default))
+    return {key.strip(): value.strip() for key, _, value in pairs if key.strip()}
+
+# --- Inference Settings ---
+
+# TTS backend: "chatterbox", "fake" (synthetic audio, no model weights) or "module:Class"
+BACKEND = env_str("TTS_BACKEND", "chatterbox")
+
+# Number of threads that run model inference concurrently
+INFERENCE_WORKERS = env_int("TTS_INFERENCE_WORKERS", 1)
+
+# Maximum number of submissions waiting for a free inference worker; further
+# ones are rejected (HTTP 429)
+INFERENCE_QUEUE_SIZE = env_int("TTS_INFERENCE_QUEUE_SIZE", 32)
+
+# --- Batching Settings ---
+
+# Maximum number of requests generated together in one batch
+BATCH_MAX_SIZE = env_int("TTS_BATCH_MAX_SIZE", 8)
+
+# How long the first request of a batch waits for others to join
+BATCH_MAX_WAIT_MS = env_float("TTS_BATCH_MAX_WAIT_MS", 10)
+
+# --- Conditioning Cache Settings ---
+
+# Maximum number of prepared voices kept in memory
+CONDITIONING_CACHE_SIZE = env_int("TTS_CONDITIONING_CACHE_SIZE", 64)
+
+# Memory budget for prepared voices, in megabytes
+CONDITIONING_CACHE_MB = env_float("TTS_CONDITIONING_CACHE_MB", 512)
+
+# --- Reference Audio Settings ---
+
+# Largest reference audio upload accepted, in megabytes
+REFERENCE_MAX_MB = env_float("TTS_REFERENCE_MAX_MB", 10)
+
+# Longer reference audio is trimmed to this many seconds before conditioning (0 = no limit)
+REFERENCE_MAX_S = env_float("TTS_REFERENCE_MAX_S", 60)
+
+# --- Voice Registry Settings ---
+
+# Directory where voices uploaded via POST /voices are stored
+VOICES_DIR = env_str("TTS_VOICES_DIR", "voices")
+
+# --- Streaming Settings ---
+
+# Generated chunks buffered between generation and encode/send in /tts-stream
+STREAM_PIPELINE_DEPTH = env_int("TTS_STREAM_PIPELINE_DEPTH", 2)
+
+# --- Incremental Streaming Settings ---
+
+# Speech tokens (25 per second of audio) in the first incremental window
+INCREMENTAL_FIRST_WINDOW_TOKENS = env_int("TTS_INCREMENTAL_FIRST_WINDOW_TOKENS", 10)
+
+# Speech tokens in each following incremental window
+INCREMENTAL_WINDOW_TOKENS = env_int("TTS_INCREMENTAL_WINDOW_TOKENS", 25)
+
+# Preceding tokens re-vocoded with each window for a seamless boundary
+INCREMENTAL_CONTEXT_TOKENS = env_int("TTS_INCREMENTAL_CONTEXT_TOKENS", 8)
+
+# Crossfade length at window boundaries, in milliseconds
+INCREMENTAL_CROSSFADE_MS = env_float("TTS_INCREMENTAL_CROSSFADE_MS", 20)
+
+# --- Text Segmentation Settings ---
+
+# Maximum characters per generation chunk (scaled per language)
+CHUNK_MAX_CHARS = env_int("TTS_CHUNK_MAX_CHARS", 200)
+
+# Smaller limit for the first chunk, for a faster time-to-first-audio
+CHUNK_FIRST_MAX_CHARS = env_int("TTS_CHUNK_FIRST_MAX_CHARS", 80)
+
+# A trailing chunk shorter than this is merged into the previous one
+CHUNK_MIN_CHARS = env_int("TTS_CHUNK_MIN_CHARS", 20)
+
+# --- Audio Cache Settings ---
+
+# Maximum number of generated chunks kept in memory (0 disables the memory tier)
+AUDIO_CACHE_SIZE = env_int("TTS_AUDIO_CACHE_SIZE", 256)
+
+# Memory budget for generated audio, in megabytes
+AUDIO_CACHE_MB = env_float("TTS_AUDIO_CACHE_MB", 256)
+
+# Directory for the on-disk audio cache tier (disabled if unset)
+AUDIO_CACHE_DIR = env_str("TTS_AUDIO_CACHE_DIR")
+
+# Disk budget for the on-disk tier, in megabytes
+AUDIO_CACHE_DISK_MB = env_float("TTS_AUDIO_CACHE_DISK_MB", 1024)
+
+# --- Admission Control Settings ---
+
+# Maximum requests (and /tts-stream messages) in flight; further ones get 429 (0 = unlimited)
+MAX_REQUESTS = env_int("TTS_MAX_REQUESTS", 64)
+
+# Seconds a request may wait before generation starts before it is dropped with 503 (0 = no deadline)
+REQUEST_TIMEOUT_S = env_float("TTS_REQUEST_TIMEOUT_S", 30)
+
+# Hard limit on a request's total generation time in seconds; generation is
+# cancelled at the next decoding step once it passes (0 = no limit)
+REQUEST_MAX_S = env_float("TTS_REQUEST_MAX_S", 0)
+
+# --- Replica Settings ---
+
+# Model replica processes; 0 runs the model in the server process
+REPLICAS = env_int("TTS_REPLICAS", 0)
+
+# Torch threads per replica (0 = one per pinned core)
+REPLICA_THREADS = env_int("TTS_REPLICA_THREADS", 0)
+
+# Pin each replica to its own subset of CPU cores
+REPLICA_PIN_CORES = env_bool("TTS_REPLICA_PIN_CORES", True)
+
+# --- Multiplexing Settings ---
+
+# Requests in flight at once on one /tts-stream connection
+STREAM_MAX_REQUESTS_PER_CONNECTION = env_int("TTS_STREAM_MAX_REQUESTS_PER_CONNECTION", 8)
+
+# Chunks of one connection's requests generated at the same time; further
+# chunks wait and are started highest priority first
+STREAM_CONNECTION_CONCURRENCY = env_int("TTS_STREAM_CONNECTION_CONCURRENCY", 1)
+
+# --- Scheduling Settings ---
+
+# Share generation time fairly between clients (weighted fair queuing per
+# chunk); otherwise chunks are generated in arrival order
+FAIR_SCHEDULING = env_bool("TTS_FAIR_SCHEDULING", True)
+
+# Priority classes and their weights, as class:weight pairs; a class with
+# twice the weight gets twice the generation time when both are waiting
+PRIORITY_CLASSES = {
+    name: float(weight)
+    for name, weight in env_dict("TTS_PRIORITY_CLASSES", ["interactive:8", "bulk:1"]).items()
+}
+
+# Class of requests that don't choose one
+DEFAULT_PRIORITY_CLASS = env_str("TTS_DEFAULT_PRIORITY_CLASS", "interactive")
+
+# Class of each API key's requests (X-API-Key header), as key:class pairs;
+# requests can ask for a lower-weight class but not a higher one
+API_KEY_CLASSES = env_dict("TTS_API_KEY_CLASSES")
+
+# --- Startup Settings ---
+
+# Local directory with the model files, loaded instead of downloading from Hugging Face
+MODEL_DIR = env_str("TTS_MODEL_DIR")
+
+# Whole-model checkpoint written by `python model_loading.py`, loaded memory-mapped
+MODEL_CHECKPOINT = env_str("TTS_MODEL_CHECKPOINT")
+
+# Inference precision: fp32, bf16 or fp16 (autocast), or int8 (dynamic
+# quantization, CPU only). Modes the device can't run fall back to fp32.
+PRECISION = env_str("TTS_PRECISION", "fp32")
+
+# Run the speech-token decoder step through torch.compile
+COMPILE = env_bool("TTS_COMPILE", False)
+
+# KV-cache lengths (prompt plus speech tokens) the compiled step is built
+# for, one graph each; longer generations finish in eager mode
+COMPILE_BUCKETS = [int(length) for length in env_list("TTS_COMPILE_BUCKETS", ["256", "512", "1024", "1536"])]
+
+# Run a warm-up synthesis per language before reporting ready
+WARMUP = env_bool("TTS_WARMUP", True)
+
+# Languages warmed up at startup
+WARMUP_LANGUAGES = env_list("TTS_WARMUP_LANGUAGES", ["en"])
+
+# Text synthesized by the warm-up pass
+WARMUP_TEXT = env_str("TTS_WARMUP_TEXT", "Hello, this is a warm-up.")
+
+# --- Fake Backend Settings ---
+
+# Generation time per character of text, in milliseconds
+FAKE_MS_PER_CHAR = env_float("TTS_FAKE_MS_PER_CHAR", 2.0)
+
+# Audio produced per character of text, in milliseconds (about 15 characters per second of speech)
+FAKE_AUDIO_MS_PER_CHAR = env_float("TTS_FAKE_AUDIO_MS_PER_CHAR", 65.0)
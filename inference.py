@@ -0,0 +1,284 @@
+import asyncio
+import contextlib
+import functools
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import DeadlineExceeded, Overloaded, expired
+
+class InferenceExecutor:
+    """
+    Runs blocking model calls on a dedicated thread pool so the event loop
+    stays free for health checks, WebSocket accepts and sends.
+
+    At most max_workers calls run at once and at most max_queue_size more
+    wait for a worker; further submissions fail with Overloaded.
+    """
+
+    def __init__(self, max_workers=1, max_queue_size=32):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-inference")
+        self._pending = 0
+
+    @property
+    def pending(self):
+        """Number of submissions currently queued or running."""
+        return self._pending
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on an inference worker and await its result.
+        Raises Overloaded if the queue is full.
+        """
+        if self._pending >= self.max_workers + self.max_queue_size:
+            raise Overloaded(1, "Inference queue is full")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    async def stream(self, gen_fn, *args, slot=None, **kwargs):
+        """
+        Run the generator function gen_fn(*args, **kwargs) on an inference
+        worker and yield its items on the event loop as they are produced.
+        slot is an optional async context manager entered before the
+        generator is submitted and exited once it has run to completion.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        done = object()
+
+        def emit(item):
+            loop.call_soon_threadsafe(items.put_nowait, item)
+
+        def drain():
+            try:
+                for item in gen_fn(*args, **kwargs):
+                    emit(item)
+                emit(done)
+            except Exception as e:
+                emit(e)
+
+        async def run():
+            try:
+                async with slot or contextlib.nullcontext():
+                    await self.run(drain)
+            except Exception as e:
+                # drain never ran (e.g. the queue was full)
+                items.put_nowait(e)
+
+        task = asyncio.ensure_future(run())
+        while True:
+            item = await items.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        await task
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and release the worker threads."""
+        self._pool.shutdown(wait=wait)
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of an InferenceExecutor.
+
+    Pending requests are grouped by key (language and speaker conditioning).
+    A group is dispatched as one batch once it holds max_batch_size items or
+    max_wait_ms has passed since its first item arrived, whichever is first.
+
+    batch_fn(key, items) runs on an inference worker and must return one
+    result per item; an Exception instance in the results fails only that item.
+
+    Items may carry a deadline (a time.monotonic() value). Items whose deadline
+    has passed by the time a worker picks up their batch fail with
+    DeadlineExceeded instead of being generated.
+
+    submit() optionally fills a timing dict with the item's "queue_wait"
+    (submission until a worker starts its batch) and "generate" (the batch's
+    run time) in seconds.
+
+    With a FairScheduler, each item is tagged under its flow when submitted
+    and a batch waits for a scheduler slot with its lowest tag before it
+    goes to the executor.
+    """
+
+    def __init__(self, executor, batch_fn, max_batch_size=8, max_wait_ms=10, scheduler=None):
+        self.executor = executor
+        self.batch_fn = batch_fn
+        self.scheduler = scheduler
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self._groups = {}
+        self._timers = {}
+        self._tasks = set()
+
+    async def submit(self, key, item, deadline=None, timing=None, flow=None, cost=1):
+        """
+        Queue an item under key and await its individual result. flow and
+        cost are the item's scheduling flow and cost (see FairScheduler.tag).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tag = self.scheduler.tag(flow, cost) if self.scheduler is not None else 0
+
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = []
+            if self.max_batch_size > 1 and self.max_wait > 0:
+                self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        group.append((item, future, deadline, time.monotonic(), timing, tag))
+
+        if len(group) >= self.max_batch_size or key not in self._timers:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key):
+        group = self._groups.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        if group:
+            task = asyncio.ensure_future(self._run_batch(key, group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, key, group):
+        # Skip items whose callers have already gone away
+        group = [entry for entry in group if not entry[1].done()]
+        if not group:
+            return
+
+        slot = self.scheduler.slot(min(entry[5] for entry in group)) if self.scheduler is not None else None
+        try:
+            async with slot or contextlib.nullcontext():
+                # Callers may also go away while the batch waits for its turn
+                group = [entry for entry in group if not entry[1].done()]
+                if not group:
+                    return
+                results, started, finished = await self.executor.run(self._run_live, key, group)
+        except Exception as e:
+            for entry in group:
+                if not entry[1].done():
+                    entry[1].set_exception(e)
+            return
+
+        for (_, future, _, submitted, timing, _), result in zip(group, results):
+            if future.done():
+                continue
+            if timing is not None:
+                timing["queue_wait"] = started - submitted
+                timing["generate"] = finished - started
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _run_live(self, key, group):
+        # Runs on the worker, so time spent waiting for a free worker counts
+        started = time.monotonic()
+        live = [i for i, entry in enumerate(group) if not expired(entry[2])]
+        results = [DeadlineExceeded() for _ in group]
+        if live:
+            for i, result in zip(live, self.batch_fn(key, [group[i][0] for i in live])):
+                results[i] = result
+        return results, started, time.monotonic()
+
+class PriorityLimiter:
+    """
+    Async limiter that lets at most max_concurrent holders in at once and
+    hands free slots to waiters in priority order (higher first), FIFO
+    among equal priorities.
+    """
+
+    def __init__(self, max_concurrent=1):
+        self.max_concurrent = max(1, max_concurrent)
+        self._active = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    @property
+    def waiting(self):
+        """Number of holders waiting for a slot."""
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, priority=0):
+        """Hold one slot for the duration of the block."""
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (-priority, next(self._order), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(None)
+                return
+        self._active -= 1
+
+class FairScheduler(PriorityLimiter):
+    """
+    Weighted fair queuing of generation work between flows, with at most
+    max_concurrent units of work running at once.
+
+    A flow is a (client, priority class) pair and weights maps class names
+    to weights (1 for classes not listed). tag() stamps a unit of work with
+    a virtual finish time when it is submitted: the later of its flow's
+    previous finish time and the current virtual time, plus cost / weight.
+    Slots go to the lowest tag first, so a flow that has had more than its
+    share waits behind one that hasn't, and a class with twice the weight
+    gets twice the share. The virtual time follows the tags of the work
+    started (self-clocked fair queuing).
+    """
+
+    # Flows remembered before finished ones are forgotten
+    MAX_FLOWS = 1024
+
+    def __init__(self, max_concurrent=1, weights=None):
+        super().__init__(max_concurrent)
+        self.weights = dict(weights or {})
+        self._virtual_time = 0.0
+        self._finish = {}
+
+    def tag(self, flow, cost=1):
+        """Virtual finish time of cost units of work for flow (None: untracked work, served next)."""
+        if flow is None:
+            return self._virtual_time
+        if len(self._finish) >= self.MAX_FLOWS:
+            # A flow whose work has all started would start from the virtual time anyway
+            self._finish = {f: t for f, t in self._finish.items() if t > self._virtual_time}
+        start = max(self._virtual_time, self._finish.get(flow, 0.0))
+        finish = start + cost / self.weights.get(flow[1], 1.0)
+        self._finish[flow] = finish
+        return finish
+
+    @asynccontextmanager
+    async def slot(self, tag=0):
+        """Hold one slot for the duration of the block, handed out lowest tag first."""
+        async with super().slot(-tag):
+            self._virtual_time = max(self._virtual_time, tag)
+            yield
@@ -0,0 +1,249 @@
+"""
+Prometheus metrics in the text exposition format, served on /metrics.
+
+Request-scoped labels (endpoint and language) live in a context variable
+set by start_request(), so stages deep in the pipeline are labelled without
+passing them around. asyncio tasks and asyncio.to_thread inherit it; plain
+executor threads don't, so stage times are observed on the event loop.
+"""
+
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cache hit up to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Audio seconds per wall-clock second; above 1 is faster than real time
+RTF_BUCKETS = (0.1, 0.25, 0.5, 1, 1.5, 2, 4, 8, 16)
+
+LANGUAGE_PATTERN = re.compile(r"^[a-z]{2,3}([_-][a-z]{2,4})?$")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base class: a named metric with a fixed set of label names."""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Gauge(Metric):
+    """Current value, read from fn() when metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return [
+            f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {_format_value(value)}"
+        ]
+
+class CounterFunc(Gauge):
+    """Monotonic total kept elsewhere, read from fn() when metrics are scraped."""
+
+    kind = "counter"
+
+class Registry:
+    """Set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+def gauge(name, help, fn):
+    return REGISTRY.register(Gauge(name, help, fn))
+
+def counter_fn(name, help, fn):
+    return REGISTRY.register(CounterFunc(name, help, fn))
+
+# --- Request Metrics ---
+
+LABELS = ("endpoint", "language")
+
+REQUESTS = counter("tts_requests_total", "Requests by outcome.", LABELS + ("status",))
+AUDIO_SECONDS = counter("tts_audio_seconds_total", "Seconds of audio generated.", LABELS)
+QUEUE_WAIT = histogram("tts_queue_wait_seconds", "Time a chunk waited for an inference worker.", LABELS)
+REFERENCE_PREPROCESS = histogram(
+    "tts_reference_preprocess_seconds", "Time to compute speaker conditionals from reference audio.", LABELS
+)
+GENERATE = histogram("tts_generate_seconds", "Model generation time per chunk.", LABELS)
+ENCODE = histogram("tts_encode_seconds", "Time to encode a chunk (WAV/base64 or PCM frame).", LABELS)
+SEND = histogram("tts_send_seconds", "Time to send a chunk to the client.", LABELS)
+TIME_TO_FIRST_CHUNK = histogram(
+    "tts_time_to_first_chunk_seconds", "Time from admission to the first audio chunk being sent.", LABELS
+)
+REAL_TIME_FACTOR = histogram(
+    "tts_real_time_factor", "Generated audio seconds divided by request wall time.", LABELS, RTF_BUCKETS
+)
+
+def language_label(language):
+    """Language codes as given by clients, bounded to keep label cardinality low."""
+    language = str(language or "").lower()
+    return language if LANGUAGE_PATTERN.match(language) else "other"
+
+class RequestMetrics:
+    """Timing state of one request, labelled by endpoint and language."""
+
+    def __init__(self, endpoint, language, start=None):
+        self.labels = {"endpoint": endpoint, "language": language_label(language)}
+        self.start = time.perf_counter() if start is None else start
+        self.audio_seconds = 0.0
+        self.first_chunk_sent = False
+        self.finished = False
+
+    def observe(self, histogram, value):
+        histogram.observe(value, **self.labels)
+
+    def first_chunk(self):
+        """Record time-to-first-chunk, once per request."""
+        if not self.first_chunk_sent:
+            self.first_chunk_sent = True
+            self.observe(TIME_TO_FIRST_CHUNK, time.perf_counter() - self.start)
+
+    def add_audio(self, num_samples, sample_rate):
+        self.audio_seconds += num_samples / sample_rate
+
+    def finish(self, status="ok"):
+        """Count the request and record its real-time factor, once."""
+        if self.finished:
+            return
+        self.finished = True
+        REQUESTS.inc(status=status, **self.labels)
+        if self.audio_seconds > 0:
+            AUDIO_SECONDS.inc(self.audio_seconds, **self.labels)
+            self.observe(REAL_TIME_FACTOR, self.audio_seconds / max(time.perf_counter() - self.start, 1e-6))
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+def start_request(endpoint, language, start=None):
+    """
+    Start timing a request and make it current for the calling task.
+    start is a time.perf_counter() value to time from instead of now.
+    """
+    request = RequestMetrics(endpoint, language, start)
+    _current.set(request)
+    return request
+
+def current():
+    """The current task's RequestMetrics, or None outside a request."""
+    return _current.get()
+
+def observe(histogram, value):
+    """Observe value with the current request's labels."""
+    request = _current.get()
+    if request is not None:
+        request.observe(histogram, value)
+    else:
+        histogram.observe(value, endpoint="none", language="none")
+
+@contextmanager
+def timed(histogram):
+    """Observe the duration of the block with the current request's labels."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - start)
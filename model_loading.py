@@ -0,0 +1,161 @@
+"""
+Model loading for the server and its replica processes.
+
+By default the model is downloaded (or read from the Hugging Face cache)
+with from_pretrained. TTS_MODEL_DIR loads the same files from a local
+directory without touching the hub. TTS_MODEL_CHECKPOINT points at a whole
+model pre-serialized with torch.save, which is loaded memory-mapped: there
+is no per-file deserialization, and replicas on one machine share the
+checkpoint's pages through the OS page cache.
+
+Export a checkpoint once with:
+
+    python model_loading.py /models/chatterbox-mtl.pt
+
+TTS_PRECISION trades a little quality for speed: "bf16" and "fp16" run
+speech-token generation under autocast (bf16 also works on recent CPUs)
+while the vocoder stays in fp32, and "int8" dynamically quantizes the linear
+layers of the speech-token decoder, which is the main cost on CPU. Compare
+the modes with test/bench_precision.py.
+"""
+
+import argparse
+import contextlib
+import os
+import time
+
+import torch
+
+import config
+
+PRECISIONS = ("fp32", "bf16", "fp16", "int8")
+
+# Modules quantized in int8 mode: the autoregressive decoder's transformer.
+# The rest of T3 is left alone (T3.device reads speech_head.weight).
+QUANTIZED_MODULES = ("t3.tfmr",)
+
+AUTOCAST_DTYPES = {
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+
+def load_model(device, model_dir=None, checkpoint=None, precision="fp32"):
+    """
+    Load ChatterboxMultilingualTTS onto device. model_dir and checkpoint
+    default to TTS_MODEL_DIR and TTS_MODEL_CHECKPOINT ("" disables them).
+    A missing or broken checkpoint falls back to the regular loaders.
+    precision (see resolve_precision) prepares the model for that mode;
+    generation must also run inside autocast(device, precision).
+    """
+    from chatterbox.mtl_tts import ChatterboxMultilingualTTS
+
+    if model_dir is None:
+        model_dir = config.MODEL_DIR
+    if checkpoint is None:
+        checkpoint = config.MODEL_CHECKPOINT
+    start = time.perf_counter()
+
+    model = None
+    if checkpoint:
+        if os.path.exists(checkpoint):
+            try:
+                model = load_checkpoint(checkpoint, device)
+                source = checkpoint
+            except Exception as e:
+                print(f"Could not load model checkpoint {checkpoint}: {e}")
+        else:
+            print(f"Model checkpoint {checkpoint} not found")
+
+    if model is None and model_dir:
+        model = ChatterboxMultilingualTTS.from_local(model_dir, device)
+        source = model_dir
+    elif model is None:
+        model = ChatterboxMultilingualTTS.from_pretrained(device=device)
+        source = "Hugging Face"
+
+    print(f"Model loaded from {source} in {time.perf_counter() - start:.1f}s")
+    if precision == "int8":
+        quantize_model(model)
+    elif precision in AUTOCAST_DTYPES:
+        vocode_in_fp32(model, device)
+    return model
+
+def resolve_precision(precision, device):
+    """
+    Validate a TTS_PRECISION value for device, falling back to "fp32" (with
+    a warning) for modes the device can't run.
+    """
+    precision = (precision or "fp32").lower()
+    device_type = str(device).split(":")[0]
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision} (expected one of {', '.join(PRECISIONS)})")
+    if precision == "int8" and device_type != "cpu":
+        print(f"int8 quantization is CPU only; using fp32 on {device}")
+        return "fp32"
+    if precision == "fp16" and device_type == "cpu":
+        print("fp16 autocast is not supported for CPU inference; using fp32 (try bf16 or int8)")
+        return "fp32"
+    return precision
+
+def quantize_model(model):
+    """Dynamically quantize the Linear layers of QUANTIZED_MODULES to int8, in place."""
+    start = time.perf_counter()
+    for path in QUANTIZED_MODULES:
+        parent_path, _, name = path.rpartition(".")
+        parent = model
+        for attr in filter(None, parent_path.split(".")):
+            parent = getattr(parent, attr)
+        module = torch.ao.quantization.quantize_dynamic(
+            getattr(parent, name), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        setattr(parent, name, module)
+    print(f"Quantized {', '.join(QUANTIZED_MODULES)} to int8 in {time.perf_counter() - start:.1f}s")
+    return model
+
+def vocode_in_fp32(model, device):
+    """
+    Run the S3Gen vocoder with autocast disabled: the waveform stays float32
+    (numpy, which the watermarker uses, has no bfloat16) and only the
+    speech-token decoder runs in reduced precision.
+    """
+    inference = model.s3gen.inference
+    device_type = str(device).split(":")[0]
+
+    def inference_fp32(*args, **kwargs):
+        with torch.autocast(device_type, enabled=False):
+            return inference(*args, **kwargs)
+
+    model.s3gen.inference = inference_fp32
+
+def autocast(device, precision):
+    """Autocast context for generation in bf16/fp16 modes; a no-op otherwise."""
+    if precision not in AUTOCAST_DTYPES:
+        return contextlib.nullcontext()
+    return torch.autocast(str(device).split(":")[0], dtype=AUTOCAST_DTYPES[precision])
+
+def load_checkpoint(path, device):
+    """Load a model saved by save_checkpoint, memory-mapping its tensors."""
+    model = torch.load(path, map_location=device, mmap=True, weights_only=False)
+    # The checkpoint records the device it was exported on
+    model.device = device
+    return model
+
+def save_checkpoint(model, path):
+    """Serialize the whole model for load_checkpoint, atomically."""
+    tmp_path = path + ".tmp"
+    torch.save(model, tmp_path)
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the TTS model as a memory-mappable checkpoint")
+    parser.add_argument("output", help="Checkpoint file to write (use it as TTS_MODEL_CHECKPOINT)")
+    parser.add_argument("--model-dir", help="Load from this local directory instead of Hugging Face")
+    args = parser.parse_args()
+
+    # Export from the CPU so the checkpoint loads on any device
+    model = load_model("cpu", model_dir=args.model_dir or "", checkpoint="")
+    save_checkpoint(model, args.output)
+    print(f"Saved model checkpoint to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Reference audio for voice cloning, handled in memory.
+
+Uploads are read in pieces up to a size limit, then decoded straight from
+the bytes into a mono tensor: nothing is written to disk, and clips over the
+duration limit are only decoded up to it.
+"""
+
+import io
+
+import torch
+
+from audio_encoding import SOUNDFILE_AVAILABLE, soundfile
+
+# Upload read size
+READ_CHUNK_BYTES = 64 * 1024
+
+class ReferenceAudioError(ValueError):
+    """Reference audio that can't be decoded (HTTP 400)."""
+
+    status_code = 400
+
+class ReferenceAudioTooLarge(ReferenceAudioError):
+    """Reference audio over the size limit (HTTP 413)."""
+
+    status_code = 413
+
+def check_size(size, max_bytes):
+    """Raise ReferenceAudioTooLarge if size bytes exceed max_bytes (None = no limit)."""
+    if max_bytes is not None and size > max_bytes:
+        raise ReferenceAudioTooLarge(f"Reference audio is larger than {max_bytes / 1024 / 1024:g} MB")
+
+async def read_upload(upload, max_bytes=None):
+    """Read an UploadFile in pieces, stopping as soon as it exceeds max_bytes."""
+    data = bytearray()
+    while True:
+        piece = await upload.read(READ_CHUNK_BYTES)
+        if not piece:
+            return bytes(data)
+        data += piece
+        check_size(len(data), max_bytes)
+
+def decode_base64_size(encoded):
+    """Decoded size of a base64 string, computed without decoding it."""
+    return len(encoded) * 3 // 4 - encoded[-2:].count("=")
+
+def decode_audio(audio_bytes, max_seconds=None):
+    """
+    Decode reference audio bytes (any format libsndfile reads) to a mono
+    float32 tensor, trimmed to its first max_seconds (None or 0 = no limit).
+    Returns (wav, sample_rate); raises ReferenceAudioError if the audio
+    can't be decoded.
+    """
+    try:
+        if SOUNDFILE_AVAILABLE:
+            with soundfile.SoundFile(io.BytesIO(audio_bytes)) as f:
+                sample_rate = f.samplerate
+                frames = int(max_seconds * sample_rate) if max_seconds else -1
+                wav = torch.from_numpy(f.read(frames, dtype="float32", always_2d=True)).T
+        else:
+            import torchaudio as ta
+
+            wav, sample_rate = ta.load(io.BytesIO(audio_bytes))
+            if max_seconds:
+                wav = wav[:, :int(max_seconds * sample_rate)]
+    except Exception as e:
+        # soundfile's message names the BytesIO object; error_string is just the cause
+        raise ReferenceAudioError(f"Could not decode reference audio: {getattr(e, 'error_string', e)}")
+
+    if wav.shape[-1] == 0:
+        raise ReferenceAudioError("Reference audio is empty")
+    return wav.mean(dim=0), sample_rate
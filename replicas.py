@@ -0,0 +1,341 @@
+"""
+Multi-process model replicas.
+
+Each replica is a separate process holding its own TTS backend (model),
+pinned to a disjoint set of CPU cores with a matching torch thread count, so
+generation scales across cores instead of contending for one interpreter and
+one model.
+
+The front end talks to replicas over torch.multiprocessing queues. Tensors
+(speaker conditionals in, generated audio out) are moved into shared memory
+by torch's queue reducers, so only small handles are pickled.
+
+Cancellation crosses the process boundary through a small shared ring of
+cancelled token ids that replicas check before every decoding step.
+"""
+
+import itertools
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+
+from backends import TTSBackend, backend_class, load_backend
+from cancellation import CancelToken, Cancelled
+
+# Messages from a replica to the front end
+READY = "ready"
+FAILED = "failed"
+RESULT = "result"
+ERROR = "error"
+ITEM = "item"
+DONE = "done"
+
+# Recently cancelled token ids remembered by the shared ring
+CANCEL_SLOTS = 256
+
+class RemoteCancel:
+    """Replica-side view of a front-end CancelToken."""
+
+    def __init__(self, token_id, deadline, ring):
+        self.token_id = token_id
+        self.deadline = deadline
+        self.ring = ring
+
+    def raise_if_cancelled(self):
+        # time.monotonic() is system-wide, so front-end deadlines apply here
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise Cancelled("request deadline exceeded")
+        if self.token_id in self.ring[:]:
+            raise Cancelled("cancelled")
+
+def split_cores(num_replicas, cores=None):
+    """Split the usable CPU cores into num_replicas contiguous groups."""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if len(cores) < num_replicas:
+        # More replicas than cores: share them round-robin
+        return [[cores[i % len(cores)]] for i in range(num_replicas)]
+    groups = []
+    per_replica, extra = divmod(len(cores), num_replicas)
+    start = 0
+    for i in range(num_replicas):
+        size = per_replica + (1 if i < extra else 0)
+        groups.append(cores[start:start + size])
+        start += size
+    return groups
+
+def _portable(value):
+    """Replace exceptions that can't be pickled back to the front end."""
+    if isinstance(value, list):
+        return [_portable(v) for v in value]
+    if isinstance(value, Exception):
+        try:
+            pickle.dumps(value)
+        except Exception:
+            return RuntimeError(f"{type(value).__name__}: {value}")
+    return value
+
+def _remote_cancel(spec, ring):
+    return RemoteCancel(spec[0], spec[1], ring) if spec is not None else None
+
+def replica_main(index, device, backend_name, cores, num_threads, tasks, results, cancelled):
+    """Entry point of a replica process: load the backend, then serve tasks."""
+    try:
+        if cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        backend = load_backend(device, backend_name)
+    except Exception as e:
+        results.put((FAILED, index, f"{type(e).__name__}: {e}"))
+        return
+
+    print(f"Replica {index} ready on {device}, cores {cores}, {torch.get_num_threads()} threads")
+    results.put((READY, index, (backend.sr, backend.generation_params())))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, op, args, kwargs = task
+        cancel = kwargs.pop("cancel", None)
+        try:
+            if op == "generate":
+                cancels = [_remote_cancel(spec, cancelled) for spec in cancel] if cancel else None
+                results.put((RESULT, task_id, _portable(backend.generate_batch(*args, cancels=cancels, **kwargs))))
+            elif op == "prepare":
+                results.put((RESULT, task_id, backend.prepare_conditionals(*args).to("cpu")))
+            elif op == "stream":
+                stream = backend.generate_stream(*args, cancel=_remote_cancel(cancel, cancelled), **kwargs)
+                for wav in stream:
+                    results.put((ITEM, task_id, wav))
+                results.put((DONE, task_id, None))
+            else:
+                raise ValueError(f"Unknown replica operation: {op}")
+        except Exception as e:
+            results.put((ERROR, task_id, _portable(e)))
+
+class ReplicaPool(TTSBackend):
+    """
+    Front-end dispatcher for a set of replica processes, usable as the
+    server's TTS backend. Conditionals stay on the CPU in this process and
+    reach the replicas through shared memory.
+
+    submit() and stream() send a task to the replica with the fewest
+    outstanding tasks. Both block the calling thread, so they are meant to be
+    called from inference worker threads, not the event loop. Their cancel
+    argument takes CancelTokens, which are forwarded to the replica.
+    Generation sessions (open_session) stay off: a session's state would live
+    in whichever replica generates each chunk.
+    """
+
+    def __init__(self, num_replicas, device="cpu", threads_per_replica=0, pin_cores=True, backend=None):
+        ctx = mp.get_context("spawn")
+        self.num_replicas = num_replicas
+        self.backend_class = backend_class(backend)
+        self._results = ctx.Queue()
+        self._tasks = []
+        self._processes = []
+        self._outstanding = [0] * num_replicas
+        self._waiters = {}  # task_id -> (replica index, Future or queue.Queue)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._cancelled = ctx.Array("q", CANCEL_SLOTS, lock=False)
+        self._cancel_cursor = 0
+        self.sr = None
+        self._generation_params = {}
+
+        core_groups = split_cores(num_replicas) if pin_cores else [None] * num_replicas
+        for i in range(num_replicas):
+            cores = core_groups[i]
+            num_threads = threads_per_replica or (len(cores) if cores else 0)
+            tasks = ctx.Queue()
+            process = ctx.Process(
+                target=replica_main,
+                args=(i, device, backend, cores, num_threads, tasks, self._results, self._cancelled),
+                name=f"tts-replica-{i}",
+                daemon=True,
+            )
+            process.start()
+            self._tasks.append(tasks)
+            self._processes.append(process)
+
+        self._wait_ready()
+        self._reader = threading.Thread(target=self._read_results, name="tts-replica-results", daemon=True)
+        self._reader.start()
+
+    def _wait_ready(self):
+        ready = 0
+        while ready < self.num_replicas:
+            try:
+                kind, index, payload = self._results.get(timeout=5)
+            except queue.Empty:
+                dead = [p.name for p in self._processes if not p.is_alive()]
+                if dead:
+                    self.shutdown()
+                    raise RuntimeError(f"Replica processes exited during startup: {', '.join(dead)}")
+                continue
+            if kind == FAILED:
+                self.shutdown()
+                raise RuntimeError(f"Replica {index} failed to load the model: {payload}")
+            self.sr, self._generation_params = payload
+            ready += 1
+
+    def _read_results(self):
+        while True:
+            try:
+                kind, task_id, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                self._fail_dead_replicas()
+                continue
+            except (EOFError, OSError):
+                return
+
+            with self._lock:
+                entry = self._waiters.get(task_id)
+                if entry is not None and kind in (RESULT, ERROR, DONE):
+                    del self._waiters[task_id]
+                    self._outstanding[entry[0]] -= 1
+            if entry is None:
+                continue
+
+            waiter = entry[1]
+            if isinstance(waiter, Future):
+                if kind == RESULT:
+                    waiter.set_result(payload)
+                else:
+                    waiter.set_exception(payload)
+            else:
+                waiter.put((kind, payload))
+
+    def _fail_dead_replicas(self):
+        dead = {i for i, p in enumerate(self._processes) if not p.is_alive()}
+        if not dead:
+            return
+        with self._lock:
+            failed = [(task_id, entry) for task_id, entry in self._waiters.items() if entry[0] in dead]
+            for task_id, (index, _) in failed:
+                del self._waiters[task_id]
+                self._outstanding[index] -= 1
+        for _, (index, waiter) in failed:
+            error = RuntimeError(f"Replica {index} exited")
+            if isinstance(waiter, Future):
+                waiter.set_exception(error)
+            else:
+                waiter.put((ERROR, error))
+
+    def _dispatch(self, op, args, kwargs, waiter):
+        with self._lock:
+            alive = [i for i, p in enumerate(self._processes) if p.is_alive()]
+            if not alive:
+                raise RuntimeError("No replica processes are running")
+            index = min(alive, key=lambda i: self._outstanding[i])
+            task_id = next(self._ids)
+            self._outstanding[index] += 1
+            self._waiters[task_id] = (index, waiter)
+        self._tasks[index].put((task_id, op, args, kwargs))
+        return task_id
+
+    def cancel(self, token_id):
+        """Mark a CancelToken id as cancelled for every replica."""
+        with self._lock:
+            self._cancelled[self._cancel_cursor] = token_id
+            self._cancel_cursor = (self._cancel_cursor + 1) % CANCEL_SLOTS
+
+    def _cancel_spec(self, token):
+        if token is None:
+            return None
+        token.add_callback(lambda: self.cancel(token.id))
+        return (token.id, token.deadline)
+
+    def submit(self, op, *args, cancel=None, **kwargs):
+        """
+        Send op to a replica and return a Future for its result. For
+        "generate", cancel is a list with one CancelToken (or None) per text.
+        """
+        if cancel is not None:
+            kwargs["cancel"] = [self._cancel_spec(token) for token in cancel]
+        future = Future()
+        self._dispatch(op, args, kwargs, future)
+        return future
+
+    def stream(self, op, *args, cancel=None, **kwargs):
+        """
+        Send a streaming op to a replica and yield its items as they arrive.
+        The task gets a token id of its own, so closing the generator early
+        stops the replica at its next decoding step without cancelling cancel.
+        """
+        token = CancelToken(cancel.deadline if cancel is not None else None)
+        if cancel is not None:
+            cancel.add_callback(token.cancel)
+        kwargs["cancel"] = self._cancel_spec(token)
+        items = queue.Queue()
+        task_id = self._dispatch(op, args, kwargs, items)
+        finished = False
+        try:
+            while True:
+                kind, payload = items.get()
+                if kind == DONE:
+                    finished = True
+                    return
+                if kind == ERROR:
+                    finished = True
+                    raise payload
+                yield payload
+        finally:
+            if not finished:
+                # The consumer stopped early: stop the replica's generation
+                token.cancel("stream closed")
+            # Drop items still in flight
+            with self._lock:
+                entry = self._waiters.get(task_id)
+                if entry is not None:
+                    self._waiters[task_id] = (entry[0], queue.Queue())
+
+    # --- TTSBackend ---
+
+    def generate_batch(self, texts, language, conds=None, cancels=None, session=None):
+        return self.submit("generate", texts, language, conds, cancel=cancels).result()
+
+    def generate_stream(self, text, language, conds=None, cancel=None, session=None, **windows):
+        return self.stream("stream", text, language, conds, cancel=cancel, **windows)
+
+    def prepare_conditionals(self, audio_bytes):
+        return self.submit("prepare", audio_bytes).result()
+
+    def generation_params(self):
+        # The replicas' backend, as reported when they started
+        return self._generation_params
+
+    def read_conditionals(self, path):
+        return self.backend_class.read_conditionals(path)
+
+    def warm_up(self, language, text):
+        """Warm up every replica: one task each, sent to idle replicas in turn."""
+        futures = [self.submit("generate", [text], language) for _ in range(self.num_replicas)]
+        return [wav for future in futures for wav in future.result()]
+
+    @property
+    def outstanding(self):
+        """Tasks currently assigned to each replica."""
+        with self._lock:
+            return list(self._outstanding)
+
+    def shutdown(self):
+        """Ask every replica to exit and wait briefly for them."""
+        for tasks in self._tasks:
+            try:
+                tasks.put(None)
+            except (OSError, ValueError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,208 @@
+"""
+Language-aware text segmentation for chunked TTS generation.
+
+Text is split into sentences using per-language rules, sentences longer than
+the chunk limit are broken at clause boundaries (then words, then characters),
+and the pieces are packed greedily into chunks. The first chunk uses a smaller
+limit so the first audio is generated quickly.
+"""
+
+import re
+
+# Sentence terminators shared by all languages, including full-width forms
+BASE_TERMINATORS = ".!?。！？"
+
+# Clause separators used to break overlong sentences
+BASE_CLAUSE_SEPARATORS = ",;:、，；："
+
+# Abbreviations that end with a period but don't end a sentence (lowercased)
+ABBREVIATIONS = {
+    "en": {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "inc", "ltd", "co", "fig", "approx", "a.m", "p.m", "dept", "est", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec"},
+    "fr": {"m", "mm", "mme", "mlle", "dr", "pr", "st", "ste", "etc", "cf", "p.ex", "av", "apr", "env"},
+    "de": {"hr", "fr", "dr", "prof", "bzw", "ca", "usw", "z.b", "d.h", "u.a", "vgl", "nr", "str", "evtl", "ggf"},
+    "es": {"sr", "sra", "srta", "dr", "dra", "ud", "uds", "etc", "p.ej", "núm", "pág", "av"},
+    "it": {"sig", "sigg", "dott", "prof", "ecc", "es", "pag", "ing", "avv"},
+    "pt": {"sr", "sra", "dr", "dra", "etc", "ex", "pág", "av", "nº"},
+    "nl": {"dhr", "mevr", "dr", "prof", "bijv", "enz", "o.a", "d.w.z", "nr"},
+}
+
+# Abbreviations that only count as one before a number, as in "No. 5" (lowercased)
+NUMBER_ABBREVIATIONS = {
+    "en": {"no", "nos"},
+}
+
+# Per-language overrides of the defaults above
+LANGUAGE_RULES = {
+    # Chinese and Japanese don't separate words with spaces and pack more
+    # speech into each character, so chunks are measured with a scale factor
+    "zh": {"joiner": "", "char_scale": 0.4},
+    "ja": {"joiner": "", "char_scale": 0.4},
+    "ko": {"char_scale": 0.6},
+    # Devanagari danda
+    "hi": {"terminators": BASE_TERMINATORS + "।॥"},
+    # Arabic question mark and comma
+    "ar": {"terminators": BASE_TERMINATORS + "؟", "clause_separators": BASE_CLAUSE_SEPARATORS + "،؛"},
+    # Greek uses ';' as its question mark
+    "el": {"terminators": BASE_TERMINATORS + ";", "clause_separators": ",:·"},
+}
+
+def language_rules(language):
+    """Resolved segmentation rules for a language code."""
+    language = (language or "en").lower()
+    rules = {
+        "terminators": BASE_TERMINATORS,
+        "clause_separators": BASE_CLAUSE_SEPARATORS,
+        "abbreviations": ABBREVIATIONS.get(language, set()),
+        "number_abbreviations": NUMBER_ABBREVIATIONS.get(language, set()),
+        "joiner": " ",
+        "char_scale": 1.0,
+    }
+    rules.update(LANGUAGE_RULES.get(language, {}))
+    return rules
+
+def split_sentences(text, language="en"):
+    """
+    Split text into sentences. ASCII terminators only end a sentence when
+    followed by whitespace (so decimals like 3.14 and URLs stay intact) and
+    the preceding word isn't a known abbreviation or a single-letter initial.
+    Full-width and script-specific terminators always end a sentence.
+    """
+    rules = language_rules(language)
+    terminators = re.escape(rules["terminators"])
+    # Terminator run, optional closing quotes/brackets, then whitespace or end
+    pattern = re.compile(rf"[{terminators}]+[\"'”’»)\]]*(?=\s|$)|[。！？।؟]+[\"'”’»)\]」』]*")
+
+    sentences = []
+    start = 0
+    for match in pattern.finditer(text):
+        end = match.end()
+        if match.group().startswith(".") and _is_abbreviation(text[start:match.start()], text[end:], rules):
+            continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+def _is_abbreviation(preceding, following, rules):
+    words = preceding.split()
+    if not words:
+        return False
+    word = words[-1].lower().lstrip("(\"'")
+    # Single-letter initials such as "J. R. R. Tolkien"
+    if len(word) == 1 and word.isalpha():
+        return True
+    if word in rules["number_abbreviations"]:
+        return following.lstrip()[:1].isdigit()
+    return word in rules["abbreviations"]
+
+def _split_clauses(sentence, separators):
+    """Split at clause separators, keeping each separator with its clause."""
+    pattern = rf"(?<=[{re.escape(separators)}])\s*"
+    return [part for part in re.split(pattern, sentence) if part.strip()]
+
+def _split_words(text, limit, joiner):
+    """Break text into pieces of at most limit characters, at spaces if possible."""
+    words = text.split() if joiner else [text]
+    pieces = []
+    current = ""
+    for word in words:
+        # Hard-cut anything that can't be split at a space
+        while len(word) > limit:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:limit])
+            word = word[limit:]
+        candidate = current + joiner + word if current else word
+        if len(candidate) > limit:
+            pieces.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _break_long(sentence, limit, rules):
+    """Break an overlong sentence into pieces of at most limit characters."""
+    pieces = []
+    for clause in _split_clauses(sentence, rules["clause_separators"]):
+        if len(clause) <= limit:
+            pieces.append(clause)
+        else:
+            pieces.extend(_split_words(clause, limit, rules["joiner"]))
+    return pieces
+
+def _pack(sentences, limit, rules):
+    """
+    Pack sentences greedily into chunks of at most limit characters, breaking
+    overlong ones; yields the chunks as they fill up.
+    """
+    joiner = rules["joiner"]
+    current = ""
+    for sentence in sentences:
+        pieces = [sentence] if len(sentence) <= limit else _break_long(sentence, limit, rules)
+        for piece in pieces:
+            # A hard-cut piece is limit characters long, so it never shares a
+            # chunk with its continuation
+            candidate = current + joiner + piece if current else piece
+            if len(candidate) <= limit:
+                current = candidate
+                continue
+            if current:
+                yield current
+            current = piece
+    if current:
+        yield current
+
+def _rest_after(text, head):
+    """The part of text after head, a chunk built from its start (whitespace may differ)."""
+    remaining = sum(1 for char in head if not char.isspace())
+    for index, char in enumerate(text):
+        if remaining == 0:
+            return text[index:].strip()
+        if not char.isspace():
+            remaining -= 1
+    return ""
+
+def segment_text(text, language="en", max_chunk_size=200, first_chunk_size=None, min_chunk_size=0):
+    """
+    Split text into chunks for generation.
+
+    - Chunks end at sentence boundaries where possible and never exceed the
+      size limit; longer sentences are split at clauses, then words, then
+      (for words longer than a chunk) characters.
+    - The first chunk is limited to first_chunk_size (if given) for a fast
+      time-to-first-audio; the rest of the text is then chunked from where
+      it ends.
+    - A trailing chunk shorter than min_chunk_size is merged into the previous
+      one if the result still fits, to avoid a tiny last generation call.
+
+    Sizes are in characters, scaled per language (e.g. CJK scripts hold more
+    speech per character).
+    """
+    rules = language_rules(language)
+    scale = rules["char_scale"]
+    max_size = max(1, int(max_chunk_size * scale))
+    first_size = max(1, int(first_chunk_size * scale)) if first_chunk_size else max_size
+    text = " ".join(text.split())
+
+    if first_size == max_size:
+        chunks = list(_pack(split_sentences(text, language), max_size, rules))
+    else:
+        chunks = []
+        first = next(_pack(split_sentences(text, language), first_size, rules), None)
+        if first:
+            chunks = [first] + list(_pack(split_sentences(_rest_after(text, first), language), max_size, rules))
+
+    if len(chunks) > 1 and len(chunks[-1]) < min_chunk_size * scale:
+        merged = chunks[-2] + rules["joiner"] + chunks[-1]
+        if len(merged) <= (first_size if len(chunks) == 2 else max_size):
+            chunks[-2:] = [merged]
+
+    return chunks
@@ -8,8 +8,11 @@ import io
 import threading
 import queue
 import time
+import array
 from pathlib import Path
 
+import audio_protocol
+
 try:
     import pygame
     PYGAME_AVAILABLE = True
@@ -76,6 +79,28 @@ class AudioPlayer:
         except Exception as e:
             print(f"Error adding audio chunk: {e}")
     
+    def add_pcm_chunk(self, pcm, sample_rate, sample_format="int16"):
+        """Add a raw PCM chunk from a binary frame to the playback queue."""
+        try:
+            if sample_format == "float32":
+                # Playback and WAV saving both use 16-bit PCM
+                samples = array.array("f")
+                samples.frombytes(pcm)
+                pcm = array.array("h", (int(max(-1.0, min(1.0, x)) * 32767) for x in samples)).tobytes()
+            
+            wav_io = io.BytesIO()
+            with wave.open(wav_io, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(sample_rate)
+                wav_file.writeframes(pcm)
+            audio_data = wav_io.getvalue()
+            
+            self.audio_chunks_data.append(audio_data)  # Store for saving
+            self.audio_queue.put(audio_data)
+        except Exception as e:
+            print(f"Error adding PCM chunk: {e}")
+    
     def wait_for_completion(self, timeout=30):
         """Wait for all audio chunks to finish playing."""
         return self.playback_finished.wait(timeout)
@@ -234,8 +259,101 @@ class AudioPlayer:
         if not self.use_pygame and hasattr(self, 'pyaudio'):
             self.pyaudio.terminate()
 
+class TTSStreamSession:
+    """
+    One /tts-stream connection carrying several concurrent utterances.
+
+    Each synthesize() call sends a request tagged with a request_id and
+    returns an async iterator over that request's messages. A background
+    receiver routes JSON messages by request_id and binary frames by the
+    stream_id announced in each request's info message, so chunks of
+    different utterances can arrive interleaved.
+    """
+    
+    def __init__(self, ws_url):
+        self.ws_url = ws_url
+        self.websocket = None
+        self._receiver = None
+        self._queues = {}  # request_id -> asyncio.Queue of messages
+        self._streams = {}  # stream_id -> request_id
+        self._ids = 0
+    
+    async def __aenter__(self):
+        self.websocket = await websockets.connect(self.ws_url)
+        self._receiver = asyncio.create_task(self._receive())
+        return self
+    
+    async def __aexit__(self, *exc):
+        self._receiver.cancel()
+        await self.websocket.close()
+    
+    async def _receive(self):
+        try:
+            async for message in self.websocket:
+                if isinstance(message, bytes):
+                    request_id = self._streams.get(audio_protocol.frame_stream_id(message))
+                    if request_id not in self._queues:
+                        continue
+                    chunk_index, sample_count, is_final, sample_format, pcm = audio_protocol.unpack_frame(message)
+                    response = {
+                        "type": "audio_chunk",
+                        "chunk_index": chunk_index,
+                        "sample_count": sample_count,
+                        "sample_format": sample_format,
+                        "pcm": pcm,
+                        "is_final": is_final,
+                    }
+                else:
+                    response = json.loads(message)
+                    request_id = response.get("request_id")
+                    if request_id not in self._queues:
+                        print(f"Untagged server message: {response}")
+                        continue
+                    if response.get("type") == "info" and "stream_id" in response:
+                        self._streams[response["stream_id"]] = request_id
+                await self._queues[request_id].put(response)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            # Wake up every open request
+            for responses in self._queues.values():
+                responses.put_nowait({"type": "error", "error": "Connection closed"})
+    
+    async def synthesize(self, text, language="en", request_id=None, priority=0, **options):
+        """
+        Send one utterance and yield its messages: the info message, then
+        audio_chunk dicts (with "pcm" bytes for binary frames), ending with
+        the final chunk, an error or a cancelled message. options are extra
+        request fields such as binary, sample_format, mode or voice_id.
+        """
+        if request_id is None:
+            self._ids += 1
+            request_id = f"r{self._ids}"
+        responses = self._queues[request_id] = asyncio.Queue()
+        request = {"text": text, "language": language, "request_id": request_id, "priority": priority}
+        request.update(options)
+        try:
+            await self.websocket.send(json.dumps(request))
+            while True:
+                response = await responses.get()
+                yield response
+                if response.get("type") in ("error", "cancelled") or response.get("is_final"):
+                    break
+        finally:
+            del self._queues[request_id]
+            for stream_id, owner in list(self._streams.items()):
+                if owner == request_id:
+                    del self._streams[stream_id]
+    
+    async def cancel(self, request_id=None):
+        """Cancel one request, or every request on the connection."""
+        message = {"type": "cancel"}
+        if request_id is not None:
+            message["request_id"] = request_id
+        await self.websocket.send(json.dumps(message))
+
 class StreamingTTSClient:
-    def __init__(self, server_url, enable_playback=True):
+    def __init__(self, server_url, enable_playback=True, binary=True, sample_format="int16", incremental=False):
         # Convert HTTP URL to WebSocket URL
         if server_url.startswith("https://"):
             self.ws_url = server_url.replace("https://", "wss://").replace("/tts", "/tts-stream")
@@ -248,6 +366,13 @@ class StreamingTTSClient:
         self.enable_playback = enable_playback
         self.audio_player = None
         
+        # Receive audio as raw PCM binary frames instead of base64 WAV in JSON
+        self.binary = binary
+        self.sample_format = sample_format
+        
+        # Stream audio per token window instead of per sentence chunk
+        self.incremental = incremental
+        
         if self.enable_playback:
             try:
                 self.audio_player = AudioPlayer()
@@ -255,6 +380,13 @@ class StreamingTTSClient:
                 print(f"Audio playback disabled: {e}")
                 self.enable_playback = False
         
+    def open_session(self):
+        """
+        Open a connection for several concurrent utterances:
+        async with client.open_session() as session: ...
+        """
+        return TTSStreamSession(self.ws_url)
+    
     def encode_audio_file(self, file_path):
         """Encode audio file to base64."""
         try:
@@ -264,7 +396,15 @@ class StreamingTTSClient:
             print(f"Error: Reference audio file not found at '{file_path}'")
             return None
     
-    async def stream_tts(self, text, language="en", reference_audio=None, output_file="streaming_output.wav", play_audio=True):
+    def _finish_stream(self, chunks_received, play_audio):
+        """Record the final chunk count once the last chunk has arrived."""
+        print("✅ All chunks received and queued for playback!")
+        # In incremental mode the total is only known at the end
+        if self.audio_player and play_audio:
+            self.audio_player.total_chunks = chunks_received
+        return chunks_received
+    
+    async def stream_tts(self, text, language="en", reference_audio=None, output_file="streaming_output.wav", play_audio=True, voice_id=None):
         """Stream TTS generation with real-time playback and save the result."""
         reference_audio_b64 = None
         
@@ -289,20 +429,48 @@ class StreamingTTSClient:
                 
                 if reference_audio_b64:
                     request["reference_audio"] = reference_audio_b64
+                elif voice_id:
+                    request["voice_id"] = voice_id
+                
+                if self.binary:
+                    request["binary"] = True
+                    request["sample_format"] = self.sample_format
+                
+                if self.incremental:
+                    request["mode"] = "incremental"
                 
                 await websocket.send(json.dumps(request))
                 print("Request sent, waiting for response...")
                 
                 total_chunks = 0
                 chunks_received = 0
+                sample_rate = None
                 
                 # Receive responses
                 async for message in websocket:
                     try:
+                        if isinstance(message, bytes):
+                            # Binary frame: header + raw PCM
+                            chunk_index, sample_count, is_final, sample_format, pcm = audio_protocol.unpack_frame(message)
+                            
+                            # Incremental streams end with an empty final frame
+                            if sample_count:
+                                chunks_received += 1
+                                print(f"🎵 Playing chunk {chunks_received}/{total_chunks or '?'} ({sample_count} samples)")
+                                
+                                if self.audio_player and play_audio:
+                                    self.audio_player.add_pcm_chunk(pcm, sample_rate, sample_format)
+                            
+                            if is_final:
+                                total_chunks = self._finish_stream(chunks_received, play_audio)
+                                break
+                            continue
+                        
                         response = json.loads(message)
                         
                         if response.get("type") == "info":
-                            total_chunks = response.get("total_chunks", 0)
+                            total_chunks = response.get("total_chunks") or 0
+                            sample_rate = response.get("sample_rate")
                             print(f"Server: {response.get('message', '')}")
                             # Set total chunks for playback tracking
                             if self.audio_player and play_audio:
@@ -314,15 +482,16 @@ class StreamingTTSClient:
                             text_chunk = response.get("text_chunk", "")
                             is_final = response.get("is_final", False)
                             
-                            chunks_received += 1
-                            print(f"🎵 Playing chunk {chunks_received}/{total_chunks}: '{text_chunk[:50]}{'...' if len(text_chunk) > 50 else ''}'")
-                            
-                            # Add to playback queue immediately
-                            if self.audio_player and play_audio:
-                                self.audio_player.add_chunk(audio_data)
+                            if audio_data:
+                                chunks_received += 1
+                                print(f"🎵 Playing chunk {chunks_received}/{total_chunks or '?'}: '{text_chunk[:50]}{'...' if len(text_chunk) > 50 else ''}'")
+                                
+                                # Add to playback queue immediately
+                                if self.audio_player and play_audio:
+                                    self.audio_player.add_chunk(audio_data)
                             
                             if is_final:
-                                print("✅ All chunks received and queued for playback!")
+                                total_chunks = self._finish_stream(chunks_received, play_audio)
                                 break
                         
                         elif response.get("type") == "error":
@@ -334,6 +503,8 @@ class StreamingTTSClient:
                     
                     except json.JSONDecodeError:
                         print(f"Failed to parse server response: {message}")
+                    except ValueError as e:
+                        print(f"Invalid binary frame: {e}")
                 
                 # Wait for playback to finish and save combined audio
                 if self.audio_player:
@@ -372,8 +543,12 @@ def main():
     parser.add_argument("--text", required=True, help="Text to synthesize")
     parser.add_argument("--lang", default="en", help="Language code")
     parser.add_argument("--ref_audio", help="Path to reference audio file for voice cloning")
+    parser.add_argument("--voice_id", help="ID of a voice registered via POST /voices")
     parser.add_argument("--output", default="streaming_output.wav", help="Output audio file")
     parser.add_argument("--no-play", action="store_true", help="Disable real-time audio playback")
+    parser.add_argument("--json", action="store_true", help="Receive base64 WAV chunks in JSON instead of binary PCM frames")
+    parser.add_argument("--incremental", action="store_true", help="Stream audio as speech tokens are generated (lowest time-to-first-audio)")
+    parser.add_argument("--sample-format", default="int16", choices=["int16", "float32"], help="PCM sample format for binary frames")
     
     args = parser.parse_args()
     
@@ -384,7 +559,13 @@ def main():
         print("Continuing without real-time playback...")
         args.no_play = True
     
-    client = StreamingTTSClient(args.server_url, enable_playback=not args.no_play)
+    client = StreamingTTSClient(
+        args.server_url,
+        enable_playback=not args.no_play,
+        binary=not args.json,
+        sample_format=args.sample_format,
+        incremental=args.incremental
+    )
     
     # Run the streaming client
     asyncio.run(client.stream_tts(
@@ -392,7 +573,8 @@ def main():
         language=args.lang,
         reference_audio=args.ref_audio,
         output_file=args.output,
-        play_audio=not args.no_play
+        play_audio=not args.no_play,
+        voice_id=args.voice_id
     ))
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of per-chunk audio encoding for /tts-stream.
+
+Compares the original path (torchaudio.save into a BytesIO, getvalue, then
+base64 in JSON; numpy tobytes plus header concatenation for binary frames)
+with pcm_buffer, which converts to int16 in one vectorized step straight
+into the outgoing frame buffer.
+
+Reports microseconds per chunk for each path and chunk duration, as JSON.
+torchaudio.save needs an audio backend (torchcodec or soundfile); if none
+is installed its rows report the error instead.
+
+Usage: python test/bench_encoding.py [--durations 0.4,1,5] [--sample-rate 24000] [--repeat 200]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audio_protocol
+from audio_encoding import pcm_buffer, wav_buffer
+
+def legacy_json(wav, sample_rate):
+    """The original JSON chunk encoding."""
+    import torchaudio as ta
+
+    buffer = io.BytesIO()
+    ta.save(buffer, wav, sample_rate, format="wav")
+    buffer.seek(0)
+    audio_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return json.dumps({"type": "audio_chunk", "chunk_index": 0, "audio_data": audio_b64, "is_final": False})
+
+def legacy_binary(wav, sample_rate):
+    """The original binary frame encoding."""
+    pcm = (wav.detach().reshape(-1).cpu().clamp(-1.0, 1.0) * 32767.0).to(torch.int16).numpy().tobytes()
+    return audio_protocol.pack_frame(0, pcm)
+
+def buffer_json(wav, sample_rate):
+    audio_b64 = base64.b64encode(wav_buffer(wav, sample_rate)).decode('ascii')
+    return json.dumps({"type": "audio_chunk", "chunk_index": 0, "audio_data": audio_b64, "is_final": False})
+
+def buffer_binary(wav, sample_rate):
+    return pcm_buffer(wav, header=audio_protocol.pack_header(0, wav.numel()))
+
+PATHS = {
+    "legacy_json": legacy_json,
+    "buffer_json": buffer_json,
+    "legacy_binary": legacy_binary,
+    "buffer_binary": buffer_binary,
+}
+
+def measure(encode, wav, sample_rate, repeat):
+    try:
+        encode(wav, sample_rate)  # warm up
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(wav, sample_rate)
+    elapsed = time.perf_counter() - start
+    return {"us_per_chunk": round(elapsed / repeat * 1e6, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-chunk audio encoding")
+    parser.add_argument("--durations", default="0.4,1,5", help="Comma-separated chunk durations in seconds")
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--repeat", type=int, default=200, help="Encodings per path and duration")
+    args = parser.parse_args()
+
+    results = {}
+    for duration in [float(d) for d in args.durations.split(",")]:
+        wav = 0.5 * torch.randn(1, int(duration * args.sample_rate)).clamp(-2.0, 2.0)
+        results[f"{duration}s"] = {
+            name: measure(encode, wav, args.sample_rate, args.repeat) for name, encode in PATHS.items()
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Load-generation benchmark for POST /tts and the /tts-stream WebSocket.
+
+Drives each protocol at one or more concurrency levels with texts drawn
+from a length distribution, and reports per run: throughput (requests and
+audio seconds per second), time-to-first-audio, inter-chunk gaps and
+end-to-end latency percentiles, as JSON.
+
+By default a local server is started with the fake backend (TTS_BACKEND=fake),
+so the serving layer can be measured on CPU without model weights.
+--url runs against an existing server instead.
+
+--baseline compares the results with an earlier JSON report and exits
+with status 1 if throughput drops or p90 latencies rise by more than
+--tolerance, so the script can gate performance regressions.
+
+Usage:
+    python test/bench_load.py [--protocols http,http-stream,ws] [--concurrency 1,4,16]
+        [--requests 32] [--lengths short:0.6,medium:0.3,long:0.1] [--output report.json]
+        [--url http://host:port] [--baseline report.json --tolerance 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+import websockets
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import audio_protocol
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while streaming audio arrives in small chunks "
+    "latency matters most for the first sentence so the server splits long text into pieces"
+).split()
+
+# Approximate text lengths in characters
+LENGTHS = {"short": 40, "medium": 200, "long": 800}
+
+def make_text(rng, length):
+    """Sentences of random words, about length characters long."""
+    sentences = []
+    total = 0
+    while total < length:
+        words = rng.choices(WORDS, k=rng.randint(6, 14))
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        total += len(sentence) + 1
+    return " ".join(sentences)
+
+def parse_lengths(spec):
+    """Parse "short:0.6,long:0.4" into ([lengths], [weights])."""
+    lengths, weights = [], []
+    for item in spec.split(","):
+        name, _, weight = item.partition(":")
+        lengths.append(LENGTHS[name] if name in LENGTHS else int(name))
+        weights.append(float(weight or 1))
+    return lengths, weights
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+# --- Protocol Drivers ---
+# Each returns a dict with latency, ttfa, gaps and audio_bytes, or raises.
+
+def run_http(base_url, text, language, stream):
+    start = time.perf_counter()
+    data = {"text": text, "language": language, "format": "pcm"}
+    if stream:
+        data["stream"] = "true"
+    first = None
+    last = None
+    gaps = []
+    audio_bytes = 0
+    with requests.post(f"{base_url}/tts", data=data, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=None):
+            now = time.perf_counter()
+            if not chunk:
+                continue
+            if first is None:
+                first = now
+            else:
+                gaps.append(now - last)
+            last = now
+            audio_bytes += len(chunk)
+    end = time.perf_counter()
+    return {"latency": end - start, "ttfa": (first or end) - start, "gaps": gaps, "audio_bytes": audio_bytes}
+
+async def run_ws(ws_url, text, language):
+    start = time.perf_counter()
+    first = None
+    last = None
+    gaps = []
+    audio_bytes = 0
+    async with websockets.connect(ws_url, max_size=None) as websocket:
+        await websocket.send(json.dumps({"text": text, "language": language, "binary": True}))
+        async for message in websocket:
+            now = time.perf_counter()
+            if isinstance(message, bytes):
+                _, sample_count, is_final, _, pcm = audio_protocol.unpack_frame(message)
+                if sample_count:
+                    if first is None:
+                        first = now
+                    else:
+                        gaps.append(now - last)
+                    last = now
+                    audio_bytes += len(pcm)
+                if is_final:
+                    break
+                continue
+            response = json.loads(message)
+            if response.get("type") == "error":
+                raise RuntimeError(response.get("error"))
+    end = time.perf_counter()
+    return {"latency": end - start, "ttfa": (first or end) - start, "gaps": gaps, "audio_bytes": audio_bytes}
+
+async def run_level(args, protocol, concurrency, texts, sample_rate):
+    """Send all texts through protocol with at most concurrency in flight."""
+    base_url = args.url.rstrip("/")
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://") + "/tts-stream"
+    pending = list(texts)
+    results = []
+    errors = []
+
+    async def worker():
+        while pending:
+            text = pending.pop()
+            try:
+                if protocol == "ws":
+                    result = await run_ws(ws_url, text, args.language)
+                else:
+                    result = await asyncio.to_thread(run_http, base_url, text, args.language, protocol == "http-stream")
+                results.append(result)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    # int16 PCM: 2 bytes per sample
+    audio_seconds = sum(r["audio_bytes"] for r in results) / 2 / sample_rate if sample_rate else None
+    return {
+        "protocol": protocol,
+        "concurrency": concurrency,
+        "requests": len(texts),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed,
+        "audio_seconds_per_s": audio_seconds / elapsed if audio_seconds is not None else None,
+        "ttfa_s": summarize([r["ttfa"] for r in results]),
+        "latency_s": summarize([r["latency"] for r in results]),
+        "inter_chunk_gap_s": summarize([gap for r in results for gap in r["gaps"]]),
+    }
+
+# --- Local Server ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args):
+    """Start app.py with the fake backend and wait until it reports ready."""
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("TTS_BACKEND", "fake")
+    env.setdefault("TTS_FAKE_MS_PER_CHAR", str(args.fake_ms_per_char))
+    # Measure the serving path, not the audio cache
+    env.setdefault("TTS_AUDIO_CACHE_SIZE", "0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if requests.get(f"{url}/health/ready", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not become ready in time")
+
+def fetch_sample_rate(url):
+    """Sample rate from a short request's X-Sample-Rate header, to convert PCM bytes to seconds."""
+    response = requests.post(f"{url}/tts", data={"text": "Hi.", "format": "pcm"}, timeout=120)
+    response.raise_for_status()
+    return int(response.headers.get("X-Sample-Rate", 0)) or None
+
+# --- Regression Check ---
+
+def compare(report, baseline, tolerance):
+    """List regressions of report against baseline beyond tolerance (a fraction)."""
+    previous = {(r["protocol"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["protocol"], result["concurrency"]))
+        if before is None:
+            continue
+        name = f"{result['protocol']}@{result['concurrency']}"
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput {before['throughput_rps']:.2f} -> {result['throughput_rps']:.2f} req/s")
+        for metric in ("ttfa_s", "latency_s"):
+            if result[metric] and before[metric] and result[metric]["p90"] > before[metric]["p90"] * (1 + tolerance):
+                regressions.append(f"{name} {metric} p90 {before[metric]['p90']:.3f} -> {result[metric]['p90']:.3f} s")
+    return regressions
+
+async def run(args):
+    rng = random.Random(args.seed)
+    lengths, weights = parse_lengths(args.lengths)
+    texts = [make_text(rng, length) for length in rng.choices(lengths, weights, k=args.requests)]
+
+    sample_rate = fetch_sample_rate(args.url)
+    results = []
+    for protocol in args.protocols.split(","):
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            result = await run_level(args, protocol, concurrency, texts, sample_rate)
+            print(
+                f"{protocol:12s} c={concurrency:<3d} {result['throughput_rps']:.2f} req/s, "
+                f"ttfa p90 {result['ttfa_s']['p90'] if result['ttfa_s'] else float('nan'):.3f}s, "
+                f"errors {result['errors']}",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    return {
+        "config": {
+            "url": args.url,
+            "requests": args.requests,
+            "lengths": args.lengths,
+            "language": args.language,
+            "seed": args.seed,
+            "fake_ms_per_char": args.fake_ms_per_char if args.launched else None,
+            "sample_rate": sample_rate,
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-generation benchmark for /tts and /tts-stream")
+    parser.add_argument("--url", help="Server to benchmark (default: start a local server with the fake backend)")
+    parser.add_argument("--protocols", default="http,http-stream,ws", help="Comma-separated: http, http-stream, ws")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per protocol and concurrency level")
+    parser.add_argument("--lengths", default="short:0.6,medium:0.3,long:0.1",
+                        help="Text length distribution: name (short, medium, long) or characters, with weights")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-ms-per-char", type=float, default=2.0, help="Fake backend speed for the local server")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    server = None
+    args.launched = args.url is None
+    if args.launched:
+        server, args.url = start_server(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Compare TTS_PRECISION modes on a fixed prompt set.
+
+A mode is a precision, optionally with "+compile" for compiled decoding
+(TTS_COMPILE), e.g. fp32+compile.
+
+Each mode loads the model (as configured by TTS_MODEL_DIR /
+TTS_MODEL_CHECKPOINT) and synthesizes every prompt with the same seed.
+Reported per mode, as JSON:
+
+- latency: generation time per prompt (mean, p50, p90) and real-time factor
+  (audio seconds per wall-clock second; above 1 is faster than real time)
+- accuracy against the fp32 output of the same prompt: duration ratio and
+  speaker similarity (cosine similarity of voice-encoder embeddings)
+- with --asr and the openai-whisper package, word error rate of a
+  transcript against the prompt text
+
+Sampling makes outputs differ run to run even in fp32, so compare the
+accuracy numbers with a second fp32 run (--modes fp32,fp32,...) as the noise
+floor.
+
+Usage:
+    python test/bench_precision.py [--modes fp32,bf16,int8,fp32+compile] [--device cpu] [--reference-audio voice.wav]
+        [--repeat 1] [--seed 0] [--asr base] [--output report.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+import torch
+import torchaudio.functional as AF
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backends import ChatterboxBackend
+
+try:
+    import whisper
+    WHISPER_AVAILABLE = True
+except ImportError:
+    WHISPER_AVAILABLE = False
+
+PROMPTS = [
+    ("en", "Hello, this is a short test."),
+    ("en", "The quick brown fox jumps over the lazy dog while the band plays on."),
+    ("en", "Please call Stella and ask her to bring these things with her from the store: six spoons of fresh "
+           "snow peas, five thick slabs of blue cheese, and maybe a snack for her brother Bob."),
+    ("en", "Latency matters most for the first sentence, so the server splits long text into smaller pieces."),
+    ("fr", "Bonjour, je voudrais réserver une table pour deux personnes ce soir."),
+    ("de", "Die Sitzung beginnt morgen um neun Uhr im großen Konferenzraum."),
+    ("es", "El tren de las ocho llega con diez minutos de retraso."),
+    ("zh", "今天天气很好，我们去公园散步吧。"),
+]
+
+# Voice encoder input rate
+VE_SAMPLE_RATE = 16000
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))]
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance divided by the reference length, ignoring case and punctuation."""
+    ref, hyp = re.findall(r"\w+", reference.lower()), re.findall(r"\w+", hypothesis.lower())
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i]
+        for j, h in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1] / max(len(ref), 1)
+
+def synthesize(backend, prompts, conds, seed, repeat):
+    """Generate every prompt; returns (waveforms, seconds per prompt)."""
+    waveforms, timings = [], []
+    for index, (language, text) in enumerate(prompts):
+        elapsed = []
+        for _ in range(repeat):
+            torch.manual_seed(seed + index)
+            start = time.perf_counter()
+            wav = backend.generate(text, language, conds)
+            elapsed.append(time.perf_counter() - start)
+        waveforms.append(wav.detach().reshape(-1).float().cpu())
+        timings.append(min(elapsed))
+    return waveforms, timings
+
+def speaker_embeddings(ve, waveforms, sample_rate):
+    wavs = [AF.resample(wav, sample_rate, VE_SAMPLE_RATE).numpy() for wav in waveforms]
+    return [torch.from_numpy(ve.embeds_from_wavs([wav], sample_rate=VE_SAMPLE_RATE)).reshape(-1) for wav in wavs]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference precision modes")
+    parser.add_argument("--modes", default="fp32,bf16,int8", help="Comma-separated modes; fp32 is always run first")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--reference-audio", help="Voice to clone for every prompt (default: the built-in voice)")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per prompt (the fastest counts)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--asr", help="Whisper model name for word error rates (needs openai-whisper)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    modes = args.modes.split(",")
+    if modes[0] != "fp32":
+        modes.insert(0, "fp32")
+    asr = None
+    if args.asr:
+        if not WHISPER_AVAILABLE:
+            parser.error("--asr needs the openai-whisper package")
+        asr = whisper.load_model(args.asr)
+
+    reference_audio = None
+    if args.reference_audio:
+        with open(args.reference_audio, "rb") as f:
+            reference_audio = f.read()
+
+    results = []
+    reference = None
+    for mode in modes:
+        precision, _, option = mode.partition("+")
+        backend = ChatterboxBackend(args.device, precision=precision, compiled=option == "compile")
+        conds = backend.prepare_conditionals(reference_audio) if reference_audio else None
+        backend.warm_up("en", "Warm-up.")
+        waveforms, timings = synthesize(backend, PROMPTS, conds, args.seed, args.repeat)
+        audio_seconds = [wav.numel() / backend.sr for wav in waveforms]
+
+        if reference is None:
+            # The fp32 voice encoder scores every mode
+            reference = {
+                "ve": backend.model.ve,
+                "durations": audio_seconds,
+                "embeddings": speaker_embeddings(backend.model.ve, waveforms, backend.sr),
+            }
+        embeddings = speaker_embeddings(reference["ve"], waveforms, backend.sr)
+        similarity = [
+            float(torch.nn.functional.cosine_similarity(a, b, dim=0))
+            for a, b in zip(embeddings, reference["embeddings"])
+        ]
+        duration_ratio = [a / b for a, b in zip(audio_seconds, reference["durations"])]
+
+        result = {
+            "mode": mode,
+            "precision": backend.precision,
+            "compiled": backend.decoder is not None,
+            "latency_s": {
+                "mean": statistics.mean(timings),
+                "p50": percentile(timings, 50),
+                "p90": percentile(timings, 90),
+            },
+            "real_time_factor": sum(audio_seconds) / sum(timings),
+            "duration_ratio_vs_fp32": {
+                "mean": statistics.mean(duration_ratio), "min": min(duration_ratio), "max": max(duration_ratio),
+            },
+            "speaker_similarity_vs_fp32": {"mean": statistics.mean(similarity), "min": min(similarity)},
+        }
+        if asr is not None:
+            errors = []
+            for (language, text), wav in zip(PROMPTS, waveforms):
+                audio = AF.resample(wav, backend.sr, 16000).numpy()
+                transcript = asr.transcribe(audio, language=language)["text"]
+                # Characters, not words, for languages written without spaces
+                if language in ("zh", "ja"):
+                    text, transcript = " ".join(text), " ".join(transcript)
+                errors.append(word_error_rate(text, transcript))
+            result["word_error_rate"] = statistics.mean(errors)
+
+        print(
+            f"{mode:13s} rtf {result['real_time_factor']:.2f}, latency p50 {result['latency_s']['p50']:.2f}s, "
+            f"speaker similarity {result['speaker_similarity_vs_fp32']['mean']:.3f}",
+            file=sys.stderr,
+        )
+        results.append(result)
+        # Only the fp32 voice encoder is kept between modes
+        del backend, conds, waveforms
+
+    report = {
+        "config": {"device": args.device, "prompts": len(PROMPTS), "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
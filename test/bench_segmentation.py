@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark the language-aware segmenter against the original sentence-regex
+chunk_text over a small multilingual corpus.
+
+Reports, per language: number of chunks, first-chunk size, mean and maximum
+chunk size, chunks over the size limit, and segmentation time.
+
+Usage: python test/bench_segmentation.py [--repeat 200] [--max-chars 200] [--first-chars 80]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from segmentation import language_rules, segment_text
+
+CORPUS = {
+    "en": (
+        "Dr. Smith arrived at 9 a.m. with a report on the Q3 numbers, which were up 3.5% from last year. "
+        "The board, however, wanted more detail: revenue by region, costs by department, and a forecast for the "
+        "next two quarters, including the impact of the new pricing model that launched in September and the "
+        "hiring freeze that started in October. Mr. Jones asked whether the numbers included the acquisition. "
+        "They did not! Everyone agreed to meet again next week."
+    ),
+    "fr": (
+        "M. Dupont est arrivé à 9 h. Il a présenté les résultats, qui étaient en hausse de 3,5 % par rapport à "
+        "l'année dernière. Le conseil voulait cependant plus de détails : le chiffre d'affaires par région, les coûts "
+        "par département, etc. Tout le monde a accepté de se revoir la semaine prochaine."
+    ),
+    "de": (
+        "Dr. Müller kam um 9 Uhr an, z.B. mit einem Bericht über die Zahlen des dritten Quartals. "
+        "Der Vorstand wollte jedoch mehr Details, bzw. eine Prognose für die nächsten beiden Quartale einschließlich "
+        "der Auswirkungen des neuen Preismodells, das im September eingeführt wurde, und des Einstellungsstopps. "
+        "Alle waren einverstanden."
+    ),
+    "zh": (
+        "今天上午九点，史密斯博士带着第三季度的报告来到了会议室。报告显示收入比去年增长了百分之三点五。"
+        "然而，董事会希望看到更多细节，包括各地区的收入、各部门的成本，以及对未来两个季度的预测，"
+        "其中还要考虑九月份推出的新定价模式和十月份开始的招聘冻结所带来的影响。大家同意下周再开会。"
+    ),
+    "ja": (
+        "午前九時にスミス博士が第三四半期の報告書を持って到着しました。売上は昨年より三・五パーセント増加しました。"
+        "しかし、取締役会は地域別の売上、部門別のコスト、そして九月に導入された新しい価格モデルと十月に始まった"
+        "採用凍結の影響を含む次の二四半期の予測など、より詳しい情報を求めました。来週また会議を開くことになりました。"
+    ),
+    "hi": (
+        "डॉक्टर स्मिथ सुबह नौ बजे तीसरी तिमाही की रिपोर्ट लेकर आए। राजस्व पिछले साल से साढ़े तीन प्रतिशत बढ़ा। "
+        "लेकिन बोर्ड और अधिक विवरण चाहता था, जैसे क्षेत्र के अनुसार राजस्व और विभाग के अनुसार लागत। सभी अगले सप्ताह फिर मिलने पर सहमत हुए।"
+    ),
+    "ar": (
+        "وصل الدكتور سميث في التاسعة صباحاً ومعه تقرير الربع الثالث. ارتفعت الإيرادات بنسبة ثلاثة ونصف بالمئة، "
+        "ولكن المجلس أراد مزيداً من التفاصيل، مثل الإيرادات حسب المنطقة والتكاليف حسب القسم؟ اتفق الجميع على الاجتماع الأسبوع المقبل."
+    ),
+    "el": (
+        "Ο Δρ. Σμιθ έφτασε στις εννέα το πρωί με την αναφορά του τρίτου τριμήνου. Πού είναι τα στοιχεία ανά περιοχή; "
+        "Το συμβούλιο ήθελε περισσότερες λεπτομέρειες, όπως το κόστος ανά τμήμα και μια πρόβλεψη για τα επόμενα δύο τρίμηνα. "
+        "Όλοι συμφώνησαν να συναντηθούν ξανά."
+    ),
+}
+
+def legacy_chunk_text(text, max_chunk_size=200):
+    """The original app.py chunk_text, kept as the baseline."""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) > max_chunk_size and current_chunk:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk += " " + sentence if current_chunk else sentence
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+def measure(segment, text, limit, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chunks = segment(text)
+    elapsed = time.perf_counter() - start
+    sizes = [len(c) for c in chunks]
+    return {
+        "chunks": len(chunks),
+        "first_chunk_chars": sizes[0] if sizes else 0,
+        "mean_chunk_chars": round(statistics.mean(sizes), 1) if sizes else 0,
+        "max_chunk_chars": max(sizes) if sizes else 0,
+        "over_limit": sum(1 for s in sizes if s > limit),
+        "us_per_text": round(elapsed / repeat * 1e6, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text segmentation")
+    parser.add_argument("--repeat", type=int, default=200, help="Segmentation runs per text for timing")
+    parser.add_argument("--max-chars", type=int, default=200, help="Maximum chunk size")
+    parser.add_argument("--first-chars", type=int, default=80, help="Maximum first chunk size")
+    args = parser.parse_args()
+
+    results = {}
+    for language, text in CORPUS.items():
+        limit = int(args.max_chars * language_rules(language)["char_scale"])
+        results[language] = {
+            "text_chars": len(text),
+            "limit": limit,
+            "legacy": measure(lambda t: legacy_chunk_text(t, args.max_chars), text, limit, args.repeat),
+            "segmenter": measure(
+                lambda t: segment_text(t, language, args.max_chars, args.first_chars, min_chunk_size=20),
+                text, limit, args.repeat,
+            ),
+        }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
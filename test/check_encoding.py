@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Correctness checks for the output encoders in audio_encoding.py.
+
+- mulaw: mulaw_bytes against a scalar port of the G.711 reference encoder
+  (and audioop.lin2ulaw where Python still ships it), over every 16-bit
+  sample value.
+- flac, opus: audio encoded in several chunks decodes back to its length.
+- mp3: audio encoded in several chunks decodes (with soundfile) back to its
+  length, plus at most the encoder delay and one frame of padding.
+
+Prints one line per check and exits non-zero if any fails.
+
+Usage: python test/check_encoding.py
+"""
+
+import io
+import math
+import os
+import sys
+import warnings
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from audio_encoding import SOUNDFILE_AVAILABLE, create_encoder, mulaw_bytes, soundfile
+
+SAMPLE_RATE = 24000
+# LAME's encoder delay in samples
+MP3_ENCODER_DELAY = 576 + 529
+
+SKIPPED = "skipped (soundfile not installed)"
+
+# --- G.711 Reference ---
+
+SEG_UEND = (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF)
+
+def linear2ulaw(pcm_val):
+    """One 16-bit sample to mu-law, as in the reference g711.c (14-bit input)."""
+    pcm_val >>= 2
+    if pcm_val < 0:
+        pcm_val = -pcm_val
+        mask = 0x7F
+    else:
+        mask = 0xFF
+    pcm_val = min(pcm_val, 8159) + 0x21
+    for seg, end in enumerate(SEG_UEND):
+        if pcm_val <= end:
+            return ((seg << 4) | ((pcm_val >> (seg + 1)) & 0x0F)) ^ mask
+    return 0x7F ^ mask
+
+# --- Checks ---
+
+def check_mulaw():
+    samples = torch.arange(-32767, 32768, dtype=torch.int32)
+    # mulaw_bytes scales by 32767 and truncates; nudge each value up by a
+    # fraction so every integer survives the float round trip
+    wav = (samples.to(torch.float64) + 0.5 * samples.sign()) / 32767.0
+    ours = mulaw_bytes(wav.unsqueeze(0))
+    ref = bytes(linear2ulaw(int(v)) for v in samples)
+    mismatches = sum(a != b for a, b in zip(ours, ref))
+    if mismatches:
+        return f"{mismatches} of {len(ref)} samples differ from the G.711 reference"
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            import audioop
+    except ImportError:
+        return None
+    if ours != audioop.lin2ulaw(samples.to(torch.int16).numpy().tobytes(), 2):
+        return "differs from audioop.lin2ulaw"
+    return None
+
+def tone(seconds):
+    t = torch.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * torch.sin(2 * math.pi * 220.0 * t)).unsqueeze(0)
+
+def streamed(encoder, wav, pieces):
+    data = [bytes(encoder.encode(piece)) for piece in wav.chunk(pieces, dim=1)]
+    return b"".join(data) + bytes(encoder.finish())
+
+def decoded_length(data):
+    return len(soundfile.read(io.BytesIO(data))[0])
+
+def check_lossless_length(output_format):
+    if not SOUNDFILE_AVAILABLE:
+        return SKIPPED
+    wav = tone(3.0)
+    for pieces in (1, 3, 40):
+        length = decoded_length(streamed(create_encoder(output_format, SAMPLE_RATE), wav, pieces))
+        if length != wav.shape[1]:
+            return f"{pieces} pieces decode to {length} samples, expected {wav.shape[1]}"
+    return None
+
+def check_mp3():
+    if not SOUNDFILE_AVAILABLE:
+        return SKIPPED
+    wav = tone(3.0)
+    for rate in (8000, 24000, 44100):
+        expected = wav.shape[1] * rate // SAMPLE_RATE
+        frame = 1152 if rate > 24000 else 576
+        for pieces in (1, 3, 40):
+            length = decoded_length(streamed(create_encoder("mp3", SAMPLE_RATE, rate), wav, pieces))
+            if not expected <= length <= expected + MP3_ENCODER_DELAY + frame:
+                return f"{pieces} pieces at {rate} Hz decode to {length} samples, expected {expected}"
+        length = decoded_length(bytes(create_encoder("mp3", SAMPLE_RATE, rate).encode_all(wav)))
+        if length != expected:
+            return f"encode_all at {rate} Hz decodes to {length} samples, expected {expected}"
+    return None
+
+CHECKS = {
+    "mulaw": check_mulaw,
+    "flac": lambda: check_lossless_length("flac"),
+    "opus": lambda: check_lossless_length("opus"),
+    "mp3": check_mp3,
+}
+
+def main():
+    failed = False
+    for name, check in CHECKS.items():
+        try:
+            error = check()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        failed = failed or error not in (None, SKIPPED)
+        print(f"{name}: {error or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Token-level incremental generation for ChatterboxMultilingualTTS.
+
+ChatterboxMultilingualTTS.generate only returns once every speech token of the
+text has been sampled and vocoded. The functions here follow the same steps as
+generate / T3.inference, but yield audio while tokens are still being produced:
+speech tokens are vocoded in fixed windows, each window re-vocodes a few
+context tokens from the previous one, and the seam is crossfaded.
+"""
+
+import threading
+
+import torch
+import torch.nn.functional as F
+from transformers.generation.logits_process import (
+    MinPLogitsWarper,
+    RepetitionPenaltyLogitsProcessor,
+    TopPLogitsWarper,
+)
+from chatterbox.mtl_tts import SUPPORTED_LANGUAGES, punc_norm
+from chatterbox.models.s3tokenizer import SPEECH_VOCAB_SIZE
+from chatterbox.models.t3.inference.alignment_stream_analyzer import LLAMA_ALIGNED_HEADS, AlignmentStreamAnalyzer
+
+from cancellation import check_cancelled
+from compiled_decoding import DecodeSession
+
+# S3 speech tokens are produced at 25 Hz
+TOKENS_PER_SECOND = 25
+
+def prepare_text_tokens(model, text, language_id):
+    """
+    Normalize and tokenize text the way ChatterboxMultilingualTTS.generate does,
+    including the duplicated row for classifier-free guidance.
+    """
+    if language_id and language_id.lower() not in SUPPORTED_LANGUAGES:
+        supported_langs = ", ".join(SUPPORTED_LANGUAGES.keys())
+        raise ValueError(
+            f"Unsupported language_id '{language_id}'. "
+            f"Supported languages: {supported_langs}"
+        )
+
+    text = punc_norm(text)
+    text_tokens = model.tokenizer.text_to_tokens(
+        text, language_id=language_id.lower() if language_id else None
+    ).to(model.device)
+    text_tokens = torch.cat([text_tokens, text_tokens], dim=0)  # Need two seqs for CFG
+
+    text_tokens = F.pad(text_tokens, (1, 0), value=model.t3.hp.start_text_token)
+    text_tokens = F.pad(text_tokens, (0, 1), value=model.t3.hp.stop_text_token)
+    return text_tokens
+
+def remove_attention_spies(tfmr, analyzer):
+    """
+    Remove the forward hooks an AlignmentStreamAnalyzer registered on tfmr.
+    It never removes them itself, so every generation would leave three more
+    behind; iter_speech_tokens hands it the attentions with set_attentions.
+    """
+    for layer_idx, _ in LLAMA_ALIGNED_HEADS:
+        attention = tfmr.layers[layer_idx].self_attn
+        for key, hook in list(attention._forward_hooks.items()):
+            if any(cell.cell_contents is analyzer for cell in hook.__closure__ or ()):
+                del attention._forward_hooks[key]
+
+def set_attentions(analyzer, attentions, offset=0):
+    """
+    Give the analyzer a step's attention maps, as its hooks would have.
+    offset is the position of the first row, if the step didn't start at 0.
+    """
+    for index, (layer_idx, head_idx) in enumerate(LLAMA_ALIGNED_HEADS):
+        attention = attentions[layer_idx][0, head_idx].cpu()
+        if offset:
+            attention = F.pad(attention, (0, 0, offset, 0))
+        analyzer.last_aligned_attns[index] = attention
+
+@torch.inference_mode()
+def compute_prefix(t3, t3_cond, batch_size):
+    """
+    KV cache of t3_cond's conditioning positions (speaker embedding, prompt
+    speech tokens, emotion), which start every prompt prepare_input_embeds
+    builds with it: per-layer (keys, values).
+    """
+    from transformers import DynamicCache
+
+    cond_emb = t3.prepare_conditioning(t3_cond).expand(batch_size, -1, -1)
+    cache = DynamicCache(config=t3.tfmr.config)
+    t3.tfmr.forward(inputs_embeds=cond_emb, past_key_values=cache, use_cache=True)
+    return [(layer.keys, layer.values) for layer in cache.layers]
+
+class GenerationSession:
+    """
+    State shared by the generations of one utterance's chunks, all in one
+    voice: its conditionals, moved to the device once, and the KV cache of
+    its conditioning prefix, computed by the first chunk and reused by the
+    rest. close() releases the cache.
+    """
+
+    def __init__(self, conds):
+        self.conds = conds
+        self.closed = False
+        self._prefix = None
+        self._lock = threading.Lock()
+
+    def prefix(self, t3, t3_cond, batch_size):
+        """The conditioning prefix for compute_prefix's arguments; None once closed."""
+        with self._lock:
+            if self._prefix is None and not self.closed:
+                self._prefix = compute_prefix(t3, t3_cond, batch_size)
+            return self._prefix
+
+    def close(self):
+        with self._lock:
+            self._prefix = None
+            self.closed = True
+
+@torch.inference_mode()
+def iter_speech_tokens(
+    model,
+    t3_cond,
+    text_tokens,
+    max_new_tokens=1000,
+    temperature=0.8,
+    cfg_weight=0.5,
+    repetition_penalty=2.0,
+    min_p=0.05,
+    top_p=1.0,
+    decoder=None,
+    session=None,
+):
+    """
+    Sample speech tokens one at a time and yield each valid token id as soon
+    as it is produced. Mirrors T3.inference; decoder optionally runs the
+    decoding steps through a compiled_decoding.CompiledDecoder, and with a
+    GenerationSession (for t3_cond's voice) the prompt starts from its
+    conditioning prefix.
+    """
+    t3 = model.t3
+    hp = t3.hp
+    text_tokens = torch.atleast_2d(text_tokens).to(dtype=torch.long, device=t3.device)
+
+    initial_speech_tokens = hp.start_speech_token * torch.ones_like(text_tokens[:, :1])
+    embeds, len_cond = t3.prepare_input_embeds(
+        t3_cond=t3_cond,
+        text_tokens=text_tokens,
+        speech_tokens=initial_speech_tokens,
+        cfg_weight=cfg_weight,
+    )
+
+    # Local analyzer instead of t3.patched_model's, so concurrent streams
+    # don't share alignment state
+    alignment_stream_analyzer = None
+    if hp.is_multilingual:
+        alignment_stream_analyzer = AlignmentStreamAnalyzer(
+            t3.tfmr,
+            None,
+            text_tokens_slice=(len_cond, len_cond + text_tokens.size(-1)),
+            alignment_layer_idx=9,
+            eos_idx=hp.stop_speech_token,
+        )
+        remove_attention_spies(t3.tfmr, alignment_stream_analyzer)
+
+    bos_token = torch.tensor([[hp.start_speech_token]], dtype=torch.long, device=embeds.device)
+    bos_embed = t3.speech_emb(bos_token) + t3.speech_pos_emb.get_fixed_embedding(0)
+    bos_embed = torch.cat([bos_embed, bos_embed])  # batch_size=2 for CFG
+    inputs_embeds = torch.cat([embeds, bos_embed], dim=1)
+
+    generated_ids = bos_token.clone()
+    min_p_warper = MinPLogitsWarper(min_p=min_p)
+    top_p_warper = TopPLogitsWarper(top_p=top_p)
+    repetition_penalty_processor = RepetitionPenaltyLogitsProcessor(penalty=float(repetition_penalty))
+
+    # After the analyzer, which may change the attention implementation
+    prefix = session.prefix(t3, t3_cond, text_tokens.size(0)) if session is not None else None
+    start = prefix[0][0].size(-2) if prefix else 0
+    step = DecodeSession(t3, decoder, output_attentions=alignment_stream_analyzer is not None, prefix=prefix)
+    output_logits, attentions = step(inputs_embeds[:, start:])
+
+    for i in range(max_new_tokens):
+        if alignment_stream_analyzer is not None:
+            set_attentions(alignment_stream_analyzer, attentions, start if i == 0 else 0)
+        logits_step = output_logits[:, -1, :]
+        cond, uncond = logits_step[0:1, :], logits_step[1:2, :]
+        logits = cond + cfg_weight * (cond - uncond)
+
+        if alignment_stream_analyzer is not None:
+            last_token = generated_ids[0, -1].item() if len(generated_ids[0]) > 0 else None
+            logits = alignment_stream_analyzer.step(logits, next_token=last_token)
+
+        ids_for_proc = generated_ids[:1, ...]
+        logits = repetition_penalty_processor(ids_for_proc, logits)
+        if temperature != 1.0:
+            logits = logits / temperature
+        logits = min_p_warper(ids_for_proc, logits)
+        logits = top_p_warper(ids_for_proc, logits)
+
+        probs = torch.softmax(logits, dim=-1)
+        next_token = torch.multinomial(probs, num_samples=1)
+        generated_ids = torch.cat([generated_ids, next_token], dim=1)
+
+        token_id = next_token.item()
+        if token_id == hp.stop_speech_token:
+            return
+        if token_id < SPEECH_VOCAB_SIZE:
+            yield token_id
+
+        next_token_embed = t3.speech_emb(next_token) + t3.speech_pos_emb.get_fixed_embedding(i + 1)
+        next_token_embed = torch.cat([next_token_embed, next_token_embed])
+        output_logits, attentions = step(next_token_embed)
+
+@torch.inference_mode()
+def vocode_tokens(model, ref_dict, tokens):
+    """Convert a list of speech token ids to a 1D waveform on the CPU."""
+    speech_tokens = torch.tensor(tokens, dtype=torch.long, device=model.device)
+    wav, _ = model.s3gen.inference(speech_tokens=speech_tokens, ref_dict=ref_dict)
+    return wav.squeeze(0).detach().cpu()
+
+def generate_waveform(model, text, language_id, conds=None, **sampling_kwargs):
+    """
+    Generate text in one piece, like model.generate, through
+    iter_speech_tokens (which sampling_kwargs are passed to).
+    """
+    conds = conds if conds is not None else model.conds
+    text_tokens = prepare_text_tokens(model, text, language_id)
+    tokens = list(iter_speech_tokens(model, conds.t3, text_tokens, **sampling_kwargs))
+    check_cancelled()
+    wav = vocode_tokens(model, conds.gen, tokens)
+    if hasattr(model, "watermarker"):
+        wav = torch.from_numpy(model.watermarker.apply_watermark(wav.numpy(), sample_rate=model.sr))
+    return wav.unsqueeze(0)
+
+def generate_stream(
+    model,
+    text,
+    language_id,
+    conds=None,
+    first_window_tokens=10,
+    window_tokens=25,
+    context_tokens=8,
+    crossfade_ms=20,
+    **sampling_kwargs,
+):
+    """
+    Yield (1, n) waveform tensors for text as speech tokens are generated.
+
+    The first window is kept short for a fast time-to-first-audio; later
+    windows are window_tokens long. Each window also re-vocodes up to
+    context_tokens preceding tokens, which are dropped from the output except
+    for a crossfade_ms overlap blended with the end of the previous window.
+    """
+    conds = conds if conds is not None else model.conds
+    samples_per_token = model.sr // TOKENS_PER_SECOND
+    # The crossfade overlaps into the re-vocoded context, so it can't exceed it
+    crossfade = min(int(model.sr * crossfade_ms / 1000), context_tokens * samples_per_token // 2)
+    fade_in = torch.linspace(0.0, 1.0, crossfade) if crossfade else None
+
+    tokens = []
+    emitted = 0  # tokens whose audio has already been sent (apart from the tail)
+    tail = None  # last crossfade samples of the previous window, not sent yet
+
+    def flush(final):
+        nonlocal emitted, tail
+        # Don't vocode a window nobody will hear
+        check_cancelled()
+        start = max(0, emitted - context_tokens)
+        wav = vocode_tokens(model, conds.gen, tokens[start:])
+        offset = min((emitted - start) * samples_per_token, wav.numel())
+
+        pieces = []
+        if tail is not None:
+            lead = wav[offset - crossfade:offset]
+            if lead.numel() == crossfade:
+                pieces.append(tail * (1.0 - fade_in) + lead * fade_in)
+            else:
+                pieces.append(tail)
+
+        body = wav[offset:]
+        if not final and crossfade and body.numel() > crossfade:
+            body, tail = body[:-crossfade], body[-crossfade:]
+        else:
+            tail = None
+        pieces.append(body)
+
+        emitted = len(tokens)
+        out = torch.cat(pieces)
+        if hasattr(model, "watermarker"):
+            out = torch.from_numpy(model.watermarker.apply_watermark(out.numpy(), sample_rate=model.sr))
+        return out.unsqueeze(0)
+
+    text_tokens = prepare_text_tokens(model, text, language_id)
+    for token in iter_speech_tokens(model, conds.t3, text_tokens, **sampling_kwargs):
+        tokens.append(token)
+        target = first_window_tokens if emitted == 0 else window_tokens
+        if len(tokens) - emitted >= target:
+            yield flush(final=False)
+
+    if len(tokens) > emitted:
+        yield flush(final=True)
+    elif tail is not None:
+        yield tail.unsqueeze(0)
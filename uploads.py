@@ -0,0 +1,106 @@
+"""
+Form uploads read in memory, with size limits applied while reading.
+
+Starlette parses a form before the endpoint runs, spooling file parts over
+1 MB to temporary files, and only then can the endpoint check their size.
+Routes built with UploadRoute parse forms with python-multipart straight
+into memory instead. A body over the limit gets 413 from its Content-Length
+before any of it is read, or as soon as reading passes the limit, and each
+part is checked against its own limit as soon as it ends.
+"""
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.routing import APIRoute
+from python_multipart import create_form_parser
+from python_multipart.exceptions import FormParserError
+from starlette.datastructures import FormData, Headers
+
+# Form bodies parsed here; anything else goes to Starlette
+FORM_TYPES = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+# Allowance for multipart boundaries and part headers
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+def decode(value):
+    return value.decode("utf-8", "replace")
+
+def too_large(what, max_bytes):
+    return HTTPException(status_code=413, detail=f"{what} is larger than {max_bytes / 1024 / 1024:g} MB")
+
+async def read_form(request, max_file_bytes, max_field_bytes):
+    """
+    Parse a request's form body into FormData, with files held in memory as
+    UploadFiles. Raises HTTPException 413 once a file part exceeds
+    max_file_bytes, another part max_field_bytes, or the body their sum,
+    and 400 if the body isn't a valid form.
+    """
+    max_body_bytes = max_file_bytes + max_field_bytes + FORM_OVERHEAD_BYTES
+    items = []
+
+    def on_field(field):
+        name, value = decode(field.field_name), field.value or b""
+        if len(value) > max_field_bytes:
+            raise too_large(f"Form field {name}", max_field_bytes)
+        items.append((name, decode(value)))
+
+    def on_file(file):
+        name = decode(file.field_name)
+        if file.size > max_file_bytes:
+            raise too_large(f"Uploaded file {name}", max_file_bytes)
+        data = file.file_object
+        data.seek(0)
+        headers = Headers({"content-type": file.content_type} if file.content_type else {})
+        items.append((name, UploadFile(data, size=file.size, filename=decode(file.file_name), headers=headers)))
+
+    received = 0
+    try:
+        # Files stay in memory; the body limit keeps them small enough
+        parser = create_form_parser(request.headers, on_field, on_file, {"MAX_MEMORY_FILE_SIZE": max_body_bytes})
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body_bytes:
+                raise too_large("Request body", max_body_bytes)
+            parser.write(chunk)
+        parser.finalize()
+    except FormParserError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid form data: {e}")
+    return FormData(items)
+
+class UploadRequest(Request):
+    """Request whose form() is parsed by read_form."""
+
+    def __init__(self, scope, receive, max_file_bytes, max_field_bytes):
+        super().__init__(scope, receive)
+        self.max_file_bytes = max_file_bytes
+        self.max_field_bytes = max_field_bytes
+        self._upload_form = None
+
+    async def form(self, **kwargs):
+        content_type = self.headers.get("content-type", "").partition(";")[0].strip().lower()
+        if content_type not in FORM_TYPES:
+            return await super().form(**kwargs)
+        if self._upload_form is None:
+            self._upload_form = await read_form(self, self.max_file_bytes, self.max_field_bytes)
+        return self._upload_form
+
+class UploadRoute(APIRoute):
+    """
+    Route whose endpoint gets an UploadRequest. Subclasses set the limits:
+    max_file_bytes per uploaded file and max_field_bytes per other field.
+    """
+
+    max_file_bytes = 1024 * 1024
+    max_field_bytes = 1024 * 1024
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        max_file_bytes, max_field_bytes = self.max_file_bytes, self.max_field_bytes
+        max_body_bytes = max_file_bytes + max_field_bytes + FORM_OVERHEAD_BYTES
+
+        async def route_handler(request):
+            length = request.headers.get("content-length", "")
+            if length.isdigit() and int(length) > max_body_bytes:
+                raise too_large("Request body", max_body_bytes)
+            return await handler(UploadRequest(request.scope, request.receive, max_file_bytes, max_field_bytes))
+
+        return route_handler
@@ -0,0 +1,91 @@
+import json
+import os
+import re
+import threading
+import time
+
+VOICE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class VoiceRegistry:
+    """
+    On-disk store of prepared speaker conditionals, so a voice is uploaded
+    and preprocessed once and then referenced by its voice_id.
+
+    Each voice is stored as <voice_id>.pt (written by conds.save) next to a
+    <voice_id>.json metadata file. load_fn(path) turns a .pt file back into
+    conditionals.
+    """
+
+    def __init__(self, directory, load_fn):
+        self.directory = directory
+        self.load_fn = load_fn
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(voice_id):
+        """Voice IDs are reference-audio content hashes."""
+        return bool(voice_id) and VOICE_ID_PATTERN.match(voice_id) is not None
+
+    def _paths(self, voice_id):
+        if not self.is_valid_id(voice_id):
+            raise KeyError(voice_id)
+        base = os.path.join(self.directory, voice_id)
+        return base + ".pt", base + ".json"
+
+    def exists(self, voice_id):
+        """Whether voice_id has been registered."""
+        try:
+            return os.path.exists(self._paths(voice_id)[0])
+        except KeyError:
+            return False
+
+    def save(self, voice_id, conds, name=None):
+        """Persist conditionals under voice_id and return its metadata."""
+        tensor_path, meta_path = self._paths(voice_id)
+        metadata = {"voice_id": voice_id, "name": name, "created_at": time.time()}
+        with self._lock:
+            # Write to temporary paths first so a crash never leaves a partial voice
+            conds.save(tensor_path + ".tmp")
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(metadata, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            os.replace(tensor_path + ".tmp", tensor_path)
+        return metadata
+
+    def load(self, voice_id):
+        """Load the conditionals for voice_id. Raises KeyError if unknown."""
+        tensor_path, _ = self._paths(voice_id)
+        if not os.path.exists(tensor_path):
+            raise KeyError(voice_id)
+        return self.load_fn(tensor_path)
+
+    def metadata(self, voice_id):
+        """Metadata for voice_id. Raises KeyError if unknown."""
+        tensor_path, meta_path = self._paths(voice_id)
+        if not os.path.exists(tensor_path):
+            raise KeyError(voice_id)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"voice_id": voice_id, "name": None, "created_at": os.path.getmtime(tensor_path)}
+
+    def list(self):
+        """Metadata for every registered voice, oldest first."""
+        voices = []
+        for filename in os.listdir(self.directory):
+            voice_id, ext = os.path.splitext(filename)
+            if ext == ".pt" and self.is_valid_id(voice_id):
+                voices.append(self.metadata(voice_id))
+        return sorted(voices, key=lambda v: v.get("created_at") or 0)
+
+    def delete(self, voice_id):
+        """Remove voice_id from disk. Raises KeyError if unknown."""
+        tensor_path, meta_path = self._paths(voice_id)
+        with self._lock:
+            if not os.path.exists(tensor_path):
+                raise KeyError(voice_id)
+            os.remove(tensor_path)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)